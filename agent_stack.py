@@ -0,0 +1,136 @@
+"""
+agent_stack.py – the SQL agent, independent of Streamlit.
+
+`streamlit_app.py` wraps these builders in `st.cache_resource`; `bench.py`
+calls them directly with a scripted chat model, so both exercise the same
+database wrapper, toolkit, prompt and executor.
+
+The LangChain agent stack is the slowest part of the app's imports, and
+fast-path / cached answers never need it, so it is only imported when the
+first agent is built (`preload_agent_modules` warms it in the background).
+"""
+import importlib
+import threading
+from pathlib import Path
+
+from sqlalchemy import inspect
+
+from db_pool import readonly_engine
+from query_cache import CachedSQLDatabase, QueryCache
+from query_guard import QueryGuard
+
+# Imported by build_agent; preloaded off the main thread at app start
+AGENT_MODULES = (
+    "langchain_community.agent_toolkits.sql.base",
+    "langchain_community.agent_toolkits.sql.toolkit",
+    "langchain_core.prompts",
+    "langchain.agents",
+    "langchain_classic.agents",     # LangChain >= 1.0
+)
+
+FORMAT_INSTRUCTIONS = """
+Use the following format in your response:
+
+Thought: Do I need to use a tool? Yes or No.
+If Yes:
+Action: the action to take, must be one of [sql_db_list_tables, sql_db_schema, sql_db_query]
+Action Input: the input to the action
+
+IMPORTANT:
+- NEVER output both a Final Answer and an Action block together.
+- If you're taking an Action, you must wait for its result before outputting a Final Answer.
+
+If No:
+Thought: Do I need to use a tool? No.
+Final Answer: the final answer to the original input question.
+
+ Always use the phrase 'Final Answer:' exactly — or the system will throw a parsing error.
+"""
+
+
+def build_sql_database(db_path: Path, cache: QueryCache, generation=None) -> CachedSQLDatabase:
+    """Read-only, pooled, guarded SQLDatabase over `db_path`."""
+    if not Path(db_path).exists():
+        raise FileNotFoundError(f"Database file not found at: {db_path}")
+
+    # ⬇️ Read-only, query_only connections, one per concurrent thread, with query timeouts
+    engine = readonly_engine(db_path)
+    # Loader bookkeeping tables (e.g. _ingest_state) and raw R*Trees are not for
+    # the agent; it reaches the R*Trees through the *_geo views
+    internal_tables = [
+        t for t in inspect(engine).get_table_names() if t.startswith("_") or "_rtree" in t
+    ]
+    return CachedSQLDatabase(
+        engine,
+        ignore_tables=internal_tables,
+        views=True,
+        cache=cache,
+        generation=generation,
+        guard=QueryGuard(engine),
+    )
+
+
+def preload_agent_modules(*extra: str) -> threading.Thread:
+    """Import the agent stack (and `extra` modules, e.g. the chat model's) in a
+    daemon thread, so the first agent question doesn't wait on it."""
+    def load():
+        for module in (*AGENT_MODULES, *extra):
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass
+
+    thread = threading.Thread(target=load, name="agent-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def build_agent(db: CachedSQLDatabase, llm, verbose: bool = True, table_info: dict | None = None):
+    """Toolkit + ReAct SQL agent + executor; the system prompt is passed per question.
+
+    `table_info` is a schema summary from an earlier `snapshot_table_info`
+    of the same schema (see prompt_bundle.py); without it one is taken now.
+    """
+    from langchain_community.agent_toolkits.sql.base import create_sql_agent
+    from langchain_community.agent_toolkits.sql.prompt import SQL_PREFIX
+    from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    try:
+        from langchain.agents import AgentExecutor
+        from langchain.agents.agent_types import AgentType
+    except ImportError:  # LangChain >= 1.0 moved the classic agents
+        from langchain_classic.agents import AgentExecutor, AgentType
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "{system_prompt}"),  # per-question, pruned by PromptPruner
+        ("system", FORMAT_INSTRUCTIONS),
+        ("system", SQL_PREFIX),
+        ("system", "You can use the following tools:\n{tools}"),
+        ("system", "Tool names: {tool_names}"),
+        MessagesPlaceholder("history"),  # ✅ keep this!
+        ("human", "{input}"),
+        ("ai", "{agent_scratchpad}")
+    ])
+
+    # Snapshot schema + sample rows now instead of on every sql_db_schema call
+    db.snapshot_table_info(table_info)
+    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+
+    _base_agent = create_sql_agent(
+        llm=llm,
+        toolkit=toolkit,
+        prompt=prompt,  # ✅ Now fully compatible
+        agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        verbose=verbose,
+    )
+
+    return AgentExecutor.from_agent_and_tools(
+        agent=_base_agent.agent,
+        tools=toolkit.get_tools(),
+        handle_parsing_errors=True,
+        return_intermediate_steps=True,
+        verbose=verbose,
+        max_iterations=50,         # Adjust this as needed
+        max_execution_time=100,    # In seconds
+    )
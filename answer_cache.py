@@ -0,0 +1,123 @@
+"""
+answer_cache.py – persistent question → final-SQL cache for the chat agent.
+
+A repeated question skips the ReAct loop: the SQL the agent settled on
+last time is re-executed against the current vehicles.db.  Entries are
+keyed on the normalized question plus hashes of the system prompt and
+the database schema, so editing `modular_prompt/` or reloading tables
+with a different schema invalidates them.  Answers that depend on the
+date they were asked ("today", a date literal in the SQL) are never cached.
+"""
+import hashlib
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+ANSWER_CACHE_FILE = Path(__file__).parent / "answer_cache.db"
+
+# Questions whose answer changes with the date they are asked
+RELATIVE_TIME_PATTERN = re.compile(
+    r"\b(now|today|tonight|tomorrow|yesterday|current(ly)?|latest|recent(ly)?"
+    r"|(this|next|last|past|previous) (hour|day|week|month|year|weekend)"
+    r"|so far|right now|at the moment)\b",
+    re.I,
+)
+# A date pinned into the SQL (e.g. today's date, written out by the agent)
+DATE_LITERAL_PATTERN = re.compile(r"'\d{4}-\d{2}-\d{2}[^']*'|'\d{8}'")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """Whitespace/case-insensitive form of an (already ASCII-cleaned) question."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.! ").lower()
+
+
+def schema_fingerprint(db_path: Path) -> str:
+    """Hash of every CREATE statement in the database (schema, not data)."""
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        ddl = [
+            row[0] for row in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY name"
+            )
+        ]
+    return text_hash("\n".join(ddl))
+
+
+def time_dependent(question: str, sql: str = "") -> bool:
+    """True when re-running the cached SQL on another day would answer differently.
+
+    SQL that computes the date itself (`date('now')`) stays correct on a
+    re-run; a question like "today" or a pinned date literal does not.
+    """
+    return bool(RELATIVE_TIME_PATTERN.search(question) or DATE_LITERAL_PATTERN.search(sql))
+
+
+def final_sql(intermediate_steps) -> str | None:
+    """The last query the agent ran through `sql_db_query`, if any."""
+    for action, _observation in reversed(intermediate_steps or []):
+        if action.tool != "sql_db_query":
+            continue
+        tool_input = action.tool_input
+        if isinstance(tool_input, dict):
+            tool_input = tool_input.get("query", "")
+        return str(tool_input).strip() or None
+    return None
+
+
+class AnswerCache:
+    """SQLite-backed store; a short-lived connection per call keeps it thread-safe."""
+
+    def __init__(self, path: Path = ANSWER_CACHE_FILE):
+        self.path = Path(path)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " question TEXT, prompt_hash TEXT, schema_hash TEXT, sql TEXT,"
+                " created_at REAL, hits INTEGER DEFAULT 0,"
+                " PRIMARY KEY (question, prompt_hash, schema_hash))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def lookup(self, question: str, prompt_hash: str, schema_hash: str) -> str | None:
+        key = (normalize_question(question), prompt_hash, schema_hash)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sql FROM answers"
+                " WHERE question = ? AND prompt_hash = ? AND schema_hash = ?",
+                key,
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE answers SET hits = hits + 1"
+                    " WHERE question = ? AND prompt_hash = ? AND schema_hash = ?",
+                    key,
+                )
+        return row[0] if row else None
+
+    def store(self, question: str, prompt_hash: str, schema_hash: str, sql: str):
+        with self._connect() as conn:
+            # Entries for an older prompt or schema can never hit again
+            conn.execute(
+                "DELETE FROM answers WHERE prompt_hash != ? OR schema_hash != ?",
+                (prompt_hash, schema_hash),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO answers"
+                " (question, prompt_hash, schema_hash, sql, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (normalize_question(question), prompt_hash, schema_hash, sql, time.time()),
+            )
+
+    def forget(self, question: str, prompt_hash: str, schema_hash: str):
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM answers"
+                " WHERE question = ? AND prompt_hash = ? AND schema_hash = ?",
+                (normalize_question(question), prompt_hash, schema_hash),
+            )
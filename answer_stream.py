@@ -0,0 +1,101 @@
+"""
+answer_stream.py – surface the agent's answer while the agent is still running.
+
+The chat model streams tokens, but `agent.invoke` only returns after the
+last ReAct step.  `AnswerStreamer` is a callback handler that
+
+  * watches the token stream of every LLM call and, once the "Final
+    Answer:" marker appears, passes the growing answer text to `on_text`
+    (throttled, so the page isn't re-rendered for every token);
+  * passes the SQL of every successful `sql_db_query` call to `on_query`,
+    so its rows can be shown before the model has finished writing about
+    them.
+
+It is independent of Streamlit: the app gives it callables that render
+into placeholders, and bench.py uses it to time the first visible output.
+Models that don't stream still get `on_text` once, when their call ends.
+"""
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+FINAL_MARKER = "Final Answer:"
+TEXT_INTERVAL_S = 0.05     # at most ~20 re-renders per second
+
+
+def _final_answer(text: str) -> str | None:
+    at = text.find(FINAL_MARKER)
+    return None if at < 0 else text[at + len(FINAL_MARKER):].lstrip()
+
+
+class AnswerStreamer(BaseCallbackHandler):
+    """Forwards final-answer text and agent query SQL as soon as they exist."""
+
+    def __init__(self, on_text=None, on_query=None, interval: float = TEXT_INTERVAL_S):
+        self.on_text = on_text
+        self.on_query = on_query
+        self.interval = interval
+        self.answer = None            # latest final-answer text
+        self.first_output_at = None   # perf_counter() of the first text / query shown
+        self._buffer = {}             # run_id → tokens of that LLM call so far
+        self._sent_at = 0.0
+        self._sql = {}                # tool run_id → SQL
+        self._lock = threading.Lock()
+
+    def _mark_output(self):
+        if self.first_output_at is None:
+            self.first_output_at = time.perf_counter()
+
+    def _send_text(self, text: str, final: bool):
+        now = time.perf_counter()
+        if not final and now - self._sent_at < self.interval:
+            return
+        self._sent_at = now
+        self.answer = text
+        self._mark_output()
+        if self.on_text:
+            self.on_text(text, final)
+
+    # -------------------------------------------------------------------- LLM
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._buffer[run_id] = ""
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._buffer[run_id] = ""
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            self._buffer[run_id] = self._buffer.get(run_id, "") + token
+            text = _final_answer(self._buffer[run_id])
+            if text:
+                self._send_text(text, final=False)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            streamed = self._buffer.pop(run_id, "")
+            if not streamed:   # non-streaming model: take the generated text
+                generations = getattr(response, "generations", None) or [[]]
+                streamed = "".join(g.text for g in generations[0])
+            text = _final_answer(streamed)
+            if text:
+                self._send_text(text.strip(), final=True)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._buffer.pop(run_id, None)
+
+    # ------------------------------------------------------------------ tools
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        if (serialized or {}).get("name") == "sql_db_query":
+            self._sql[run_id] = input_str
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        sql = self._sql.pop(run_id, None)
+        output = str(getattr(output, "content", output) or "")
+        # Empty results and error / guard feedback have nothing to show
+        if sql and output.startswith("[") and self.on_query:
+            self._mark_output()
+            self.on_query(sql)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._sql.pop(run_id, None)
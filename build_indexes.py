@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+build_indexes.py  ────────────────────────────────────────────────────────
+Create the indexes implied by modular_prompt/structured_memory.json, then
+run ANALYZE so the query planner has statistics for them.
+
+Usage:  python build_indexes.py [sqlite_db] [structured_memory.json]
+
+Every table's `keys` become one (composite) index, and every join column
+gets an index unless it is already the leading column of another one.
+Tables or columns that are not present in the database are skipped, and
+so are column sets an existing index (e.g. the loader's unique upsert
+key or a primary key) already leads with.
+"""
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+STRUCTURED_MEMORY = Path(__file__).parent / "modular_prompt" / "structured_memory.json"
+GTFS_SECTION = "GTFS Static Tables"
+
+
+def declared_indexes(memory: dict) -> dict[str, list[tuple[str, ...]]]:
+    """Map table → list of column tuples to index, from structured memory."""
+    wanted: dict[str, list[tuple[str, ...]]] = {}
+
+    def add(table: str, columns):
+        columns = tuple(columns)
+        if columns and columns not in wanted.setdefault(table, []):
+            wanted[table].append(columns)
+
+    for table, spec in memory.items():
+        if table == GTFS_SECTION:
+            # {"trips": ["route_id", "block_id", ...], ...}
+            for gtfs_table, columns in spec.get("joins", {}).items():
+                for column in columns:
+                    add(gtfs_table, [column])
+            continue
+
+        add(table, spec.get("keys", []))
+        for other, pairs in spec.get("joins", {}).items():
+            # ["bus_id → bus_id", "block_id → block_id"]: ours → other table's
+            split = [[side.strip() for side in pair.split("→")] for pair in pairs]
+            add(table, [local for local, _ in split])
+            for local, remote in split:
+                add(table, [local])
+                add(other, [remote])
+
+    # A single-column index is redundant if another index leads with it
+    for table, indexes in wanted.items():
+        wanted[table] = [
+            cols for cols in indexes
+            if len(cols) > 1
+            or not any(other != cols and other[0] == cols[0] for other in indexes)
+        ]
+    return wanted
+
+
+def existing_indexes(conn: sqlite3.Connection, table: str) -> dict[str, tuple[str, ...]]:
+    """Map index name → its columns, in order, for every index already on `table`."""
+    return {
+        row[1]: tuple(col[2] for col in conn.execute(f'PRAGMA index_info("{row[1]}")'))
+        for row in conn.execute(f'PRAGMA index_list("{table}")')
+    }
+
+
+def build_indexes(conn: sqlite3.Connection,
+                  memory_path: Path = STRUCTURED_MEMORY,
+                  analyze: bool = True) -> list[str]:
+    """Create missing indexes for the declared keys/joins and ANALYZE.
+
+    With analyze=False the cheaper `PRAGMA optimize` is run instead, which
+    only re-analyzes tables whose statistics look stale.
+    Returns the names of the indexes that exist afterwards.
+    """
+    memory = json.loads(Path(memory_path).read_text(encoding="utf-8"))
+    tables = {
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table';"
+        )
+    }
+
+    created = []
+    for table, indexes in declared_indexes(memory).items():
+        if table not in tables:
+            continue
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        on_table = existing_indexes(conn, table)
+        for columns in indexes:
+            if not set(columns) <= existing:
+                print(f"  ⚠️  `{table}` has no column(s) {', '.join(columns)}; skipped")
+                continue
+            name = f"idx_{table}__{'_'.join(columns)}"
+            # Equality lookups on these columns can already use that index
+            covering = [
+                index for index, cols in on_table.items()
+                if index != name and set(cols[:len(columns)]) == set(columns)
+            ]
+            if covering:
+                if name in on_table:   # duplicate left by an earlier run
+                    conn.execute(f'DROP INDEX "{name}"')
+                created.append(covering[0])
+                continue
+            cols_sql = ", ".join(f'"{c}"' for c in columns)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({cols_sql})')
+            created.append(name)
+
+    conn.execute("ANALYZE" if analyze else "PRAGMA optimize")
+    conn.commit()
+    print(f"🔎 {len(created)} indexes in place; statistics refreshed")
+    return created
+
+
+if __name__ == "__main__":
+    db_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("vehicles.db")
+    memory_file = Path(sys.argv[2]) if len(sys.argv) > 2 else STRUCTURED_MEMORY
+    if not db_file.exists():
+        sys.exit(f"Database file not found at: {db_file}")
+    with sqlite3.connect(db_file) as connection:
+        build_indexes(connection, memory_file)
@@ -0,0 +1,90 @@
+"""
+chat_history.py – per-session, append-only chat history.
+
+Replaces the shared `chat_history.json`, which was rewritten in full twice
+per question.  Each message is one INSERT into a SQLite table keyed by
+session, sessions are capped at MAX_MESSAGES rows, and the agent only gets
+the most recent turns that fit in a token budget.
+"""
+import sqlite3
+import time
+from pathlib import Path
+
+CHAT_HISTORY_FILE = Path(__file__).parent / "chat_history.db"
+MAX_MESSAGES = 200            # kept per session (on disk and on screen)
+HISTORY_TOKEN_BUDGET = 1_500  # tokens of past conversation sent to the agent
+MAX_MESSAGE_CHARS = 2_000     # longer messages are clipped in the agent's history
+
+
+class HistoryStore:
+    """SQLite-backed store; a short-lived connection per call keeps it thread-safe."""
+
+    def __init__(self, path: Path = CHAT_HISTORY_FILE, max_messages: int = MAX_MESSAGES):
+        self.path = Path(path)
+        self.max_messages = max_messages
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT,"
+                " role TEXT, content TEXT, created_at REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages__session"
+                " ON messages (session_id, id)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def append(self, session_id: str, role: str, content: str):
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO messages (session_id, role, content, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (session_id, role, content, time.time()),
+            )
+            # Keep the session bounded: drop rows that fell out of the window
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id <= ("
+                " SELECT id FROM messages WHERE session_id = ?"
+                " ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.max_messages),
+            )
+        return cur.lastrowid
+
+    def load(self, session_id: str) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT role, content FROM ("
+                " SELECT id, role, content FROM messages WHERE session_id = ?"
+                " ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (session_id, self.max_messages),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def clear(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+
+def windowed_history(messages, count_tokens, budget: int = HISTORY_TOKEN_BUDGET):
+    """Most recent messages that fit in `budget` tokens, as LangChain messages.
+
+    `count_tokens(text)` measures a message; older messages are dropped first.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    window, used = [], 0
+    for msg in reversed(messages):
+        if msg["role"] not in ("user", "assistant"):
+            continue
+        content = str(msg["content"])
+        if len(content) > MAX_MESSAGE_CHARS:
+            content = content[:MAX_MESSAGE_CHARS] + " …"
+        used += count_tokens(content)
+        if used > budget:
+            break
+        cls = HumanMessage if msg["role"] == "user" else AIMessage
+        window.append(cls(content=content))
+    return window[::-1]
@@ -0,0 +1,184 @@
+"""
+columnar_cache.py – typed Arrow IPC copies of loaded GTFS feeds and CSVs.
+
+The loaders parse CSV text and infer column types on every run.  After a
+successful load, each table is also written here as an uncompressed Arrow
+IPC file, under the SHA-256 of the source file:
+
+    .columnar_cache/feeds/<zip hash>/<table>.arrow   (convert_to_sql.py)
+    .columnar_cache/frames/<csv hash>.arrow          (sqlite.py)
+
+Loading an unchanged feed again (e.g. into a fresh vehicles.db) reads the
+memory-mapped batches instead of re-parsing, and `open_table()` gives the
+same data to DataFrame-level analytics without going through SQLite.
+
+pyarrow is optional: without it every function here is a no-op and the
+loaders parse the CSVs as before.
+"""
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # the loaders still work, just without the cache
+    pa = None
+
+CACHE_DIR = Path(__file__).parent / ".columnar_cache"
+MAX_FEEDS = 3            # feed versions kept on disk
+MAX_FRAMES = 64          # cached CSV frames kept on disk
+LATEST_FEED = "latest_feed"
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _prune(folder: Path, keep: int):
+    entries = sorted(folder.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in entries[keep:]:
+        if stale.is_dir():
+            shutil.rmtree(stale, ignore_errors=True)
+        elif stale.suffix == ".arrow":
+            stale.unlink(missing_ok=True)
+
+
+###############################################################################
+# ---------- GTFS feeds (convert_to_sql.py) -----------------------------------
+###############################################################################
+def _arrow_types(conn, table: str, names) -> list:
+    """Arrow type per column from the storage classes actually present."""
+    probes = ", ".join(f'GROUP_CONCAT(DISTINCT typeof("{c}"))' for c in names)
+    present = conn.execute(f'SELECT {probes} FROM "{table}"').fetchone()
+    types = []
+    for classes in present:
+        classes = set((classes or "null").split(",")) - {"null"}
+        if classes <= {"integer"}:
+            types.append(pa.int64() if classes else pa.string())
+        elif classes <= {"integer", "real"}:
+            types.append(pa.float64())
+        else:   # text (e.g. "N/A" in an INTEGER column): affinity re-converts on load
+            types.append(pa.string())
+    return types
+
+
+def write_feed(conn, feed_key: str, tables, cache_dir: Path = CACHE_DIR,
+               chunk_size: int = 50_000) -> Path | None:
+    """Snapshot `tables` (as stored in SQLite) into the cache for `feed_key`."""
+    if pa is None:
+        return None
+    feeds = Path(cache_dir) / "feeds"
+    target = feeds / feed_key
+    partial = feeds / f".{feed_key}.part"
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+
+    for table in tables:
+        info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        if not info:
+            continue
+        names = [row[1] for row in info]
+        schema = pa.schema(
+            [pa.field(n, t) for n, t in zip(names, _arrow_types(conn, table, names))],
+            # declared types, so a reload recreates the same table
+            metadata={"sql_types": ",".join(row[2] for row in info)},
+        )
+        as_text = [i for i, f in enumerate(schema) if f.type == pa.string()]
+        cursor = conn.execute(f'SELECT * FROM "{table}"')
+        with pa.ipc.new_file(str(partial / f"{table}.arrow"), schema) as writer:
+            while rows := cursor.fetchmany(chunk_size):
+                columns = [list(col) for col in zip(*rows)]
+                for i in as_text:
+                    columns[i] = [None if v is None else str(v) for v in columns[i]]
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(partial, target)
+    (Path(cache_dir) / LATEST_FEED).write_text(feed_key)
+    _prune(feeds, MAX_FEEDS)
+    return target
+
+
+def cached_feed(feed_key: str, cache_dir: Path = CACHE_DIR) -> dict | None:
+    """{table: arrow file} for a completely cached feed, else None."""
+    if pa is None or not feed_key:
+        return None
+    folder = Path(cache_dir) / "feeds" / feed_key
+    if not folder.is_dir():
+        return None
+    os.utime(folder)   # most recently used survives _prune
+    (Path(cache_dir) / LATEST_FEED).write_text(feed_key)
+    return {path.stem: path for path in sorted(folder.glob("*.arrow"))}
+
+
+def read_batches(path: Path):
+    """(header, sql_types, iterator of row-tuple chunks) from a memory-mapped file."""
+    reader = pa.ipc.open_file(pa.memory_map(str(path)))
+    schema = reader.schema
+    sql_types = schema.metadata[b"sql_types"].decode().split(",")
+
+    def chunks():
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            yield list(zip(*(column.to_pylist() for column in batch.columns)))
+
+    return schema.names, sql_types, chunks()
+
+
+def open_table(table: str, feed_key: str | None = None, cache_dir: Path = CACHE_DIR):
+    """Memory-mapped pyarrow.Table of a GTFS table (default: the latest feed).
+
+    For analytics outside SQLite, e.g. `open_table("stop_times").to_pandas()`.
+    Returns None when nothing is cached.
+    """
+    if pa is None:
+        return None
+    if feed_key is None:
+        latest = Path(cache_dir) / LATEST_FEED
+        if not latest.exists():
+            return None
+        feed_key = latest.read_text().strip()
+    path = Path(cache_dir) / "feeds" / feed_key / f"{table}.arrow"
+    if not path.exists():
+        return None
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+
+
+###############################################################################
+# ---------- CSV frames (sqlite.py) -------------------------------------------
+###############################################################################
+def read_frame(digest: str, cache_dir: Path = CACHE_DIR):
+    """The typed DataFrame cached for a CSV with this hash, or None."""
+    if pa is None:
+        return None
+    path = Path(cache_dir) / "frames" / f"{digest}.arrow"
+    if not path.exists():
+        return None
+    os.utime(path)
+    return feather.read_feather(path, memory_map=True)
+
+
+def write_frame(digest: str, df, cache_dir: Path = CACHE_DIR):
+    if pa is None:
+        return
+    frames = Path(cache_dir) / "frames"
+    frames.mkdir(parents=True, exist_ok=True)
+    partial = frames / f".{digest}.part"
+    try:
+        feather.write_feather(df, partial, compression="uncompressed")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError):
+        partial.unlink(missing_ok=True)   # e.g. mixed-type object column
+        return
+    os.replace(partial, frames / f"{digest}.arrow")
+    _prune(frames, MAX_FRAMES)
@@ -4,86 +4,395 @@ ingest_gtfs_to_sqlite.py  ──────────────────
 Load every .txt file inside a GTFS zip into SQLite, one table per file.
 
 Usage:  python ingest_gtfs_to_sqlite.py <gtfs.zip> [sqlite_db]
+                [--chunk-size N] [--sample-rows N] [--workers N] [--no-cache]
 
 If [sqlite_db] is omitted, the script creates/uses 'vehicles.db'
 in the same directory as the zip.
+
+Each member is streamed through the csv module in fixed-size chunks and
+inserted with one prepared `executemany`, so memory stays flat no matter
+how large `stop_times.txt` gets.  Column types are inferred from the
+first --sample-rows rows; SQLite's column affinity converts the rest.
+
+With --workers N, members are decoded and type-converted in a pool of N
+processes while a single writer thread drains their row batches into the
+SQLite connection, keeping SQLite's one-writer rule.
+
+After a load, the tables are also kept as typed Arrow files keyed by the
+zip's hash (columnar_cache.py, needs pyarrow); loading the same feed
+again reads those instead of parsing.  --no-cache turns this off.
 """
-import sys
+import argparse
+import csv
+import io
+import multiprocessing
 import sqlite3
+import threading
+import time
 import zipfile
-import io
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-import pandas as pd
 
+import columnar_cache
+from build_indexes import build_indexes
+from columnar_cache import CACHE_DIR, file_hash
+from gtfs_schedule import HORIZON_DAYS, refresh_schedule
+from rollups import refresh_rollups
+from spatial_index import refresh_spatial
 
-def sql_dtype(pd_dtype):
-    """Map pandas dtype → SQLite column type."""
-    if pd_dtype.kind in ("i", "u"):       # int / uint
-        return "INTEGER"
-    if pd_dtype.kind == "f":              # float
-        return "REAL"
-    return "TEXT"                         # default
+DEFAULT_CHUNK_SIZE = 50_000     # rows per executemany batch
+DEFAULT_SAMPLE_ROWS = 10_000    # rows used to infer column types
 
+# Relaxed durability for the duration of a bulk load; restored afterwards.
+# (synchronous=NORMAL is the fast-yet-safe setting for a live WAL database.)
+INGEST_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -262144,       # negative → KiB, i.e. 256 MiB page cache
+}
 
-def load_gtfs_zip(zip_path: Path, db_path: Path):
-    print(f"→ Opening GTFS archive: {zip_path}")
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        txt_files = [m for m in zf.namelist() if m.endswith(".txt")]
-        if not txt_files:
-            raise RuntimeError("No .txt files found in the zip!")
-
-        for txt in txt_files:
-            table = Path(txt).stem.lower()  # e.g. 'agency.txt' → 'agency'
-            print(f"  • Loading {txt}  →  table `{table}`")
-
-            # Read into DataFrame
-            with zf.open(txt) as fp:
-                df = pd.read_csv(
-                    io.TextIOWrapper(fp, encoding="utf-8-sig"),
-                    dtype=str,              # keep everything as str first
-                    na_values="",           # treat empty strings as NaN
-                    keep_default_na=False,
-                )
-
-            # Infer dtypes (simple heuristic)
-            for col in df.columns:
-                # Try int
-                try:
-                    df[col] = pd.to_numeric(df[col], downcast="integer")
-                except ValueError:
-                    pass
-                # Try float
+
+def infer_sql_type(values) -> str:
+    """Pick INTEGER / REAL / TEXT for a column from a sample of its values."""
+    kind = "INTEGER"
+    for value in values:
+        if value == "":
+            continue
+        if kind == "INTEGER":
+            try:
+                int(value)
+                continue
+            except ValueError:
+                kind = "REAL"
+        try:
+            float(value)
+        except ValueError:
+            return "TEXT"
+    return kind
+
+
+def quote_ident(name: str) -> str:
+    """Quote a table/column name for use in SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+@contextmanager
+def ingest_pragmas(conn: sqlite3.Connection):
+    """Apply INGEST_PRAGMAS while the block runs, then restore the old values.
+
+    The database is also switched (persistently) to WAL mode: readers keep
+    their snapshot while a load is in progress and see the new data only at
+    COMMIT, so the published file is never missing or half-built.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    previous = {
+        name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in INGEST_PRAGMAS
+    }
+    for name, value in INGEST_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    try:
+        yield conn
+    finally:
+        for name, value in previous.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        # Fold the load back into the main file; frames pinned by readers stay
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def iter_row_chunks(reader, width: int, chunk_size: int):
+    """Yield lists of row tuples (blank → NULL, ragged rows padded/truncated)."""
+    while True:
+        chunk = [
+            tuple(v if v != "" else None for v in (row + [""] * width)[:width])
+            for row in islice(reader, chunk_size)
+            if row
+        ]
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_header_and_sample(reader, sample_rows: int):
+    """Return (header, types, sample_rows) for a csv reader, or None if empty."""
+    header = [c.strip() for c in next(reader, [])]
+    if not header:
+        return None
+    width = len(header)
+
+    # Bounded sample for type inference; it is inserted like any other chunk
+    sample = next(iter_row_chunks(reader, width, sample_rows), [])
+    types = [
+        infer_sql_type(row[i] or "" for row in sample) for i in range(width)
+    ]
+    return header, types, sample
+
+
+def create_table(cur, table: str, header, types):
+    """(Re)create `table` and return the prepared INSERT statement for it."""
+    columns_sql = ",\n  ".join(
+        f"{quote_ident(c)} {t}" for c, t in zip(header, types)
+    )
+    cur.execute(f"DROP TABLE IF EXISTS {quote_ident(table)}")
+    cur.execute(f"CREATE TABLE {quote_ident(table)} (\n  {columns_sql}\n);")
+    return (
+        f"INSERT INTO {quote_ident(table)} VALUES "
+        f"({', '.join('?' * len(header))})"
+    )
+
+
+def convert_chunk(chunk, types):
+    """Convert INTEGER/REAL columns to Python numbers, keeping unparsable text."""
+    casts = [
+        (i, int if t == "INTEGER" else float)
+        for i, t in enumerate(types) if t != "TEXT"
+    ]
+    if not casts:
+        return chunk
+    converted = []
+    for row in chunk:
+        row = list(row)
+        for i, cast in casts:
+            value = row[i]
+            if value is not None:
                 try:
-                    df[col] = pd.to_numeric(df[col], downcast="float")
+                    row[i] = cast(value)
                 except ValueError:
-                    pass
+                    try:
+                        row[i] = float(value)
+                    except ValueError:
+                        pass
+        converted.append(tuple(row))
+    return converted
+
+
+def load_member(cur, zf: zipfile.ZipFile, member: str,
+                chunk_size: int = DEFAULT_CHUNK_SIZE,
+                sample_rows: int = DEFAULT_SAMPLE_ROWS) -> int:
+    """Stream one GTFS .txt member into its table; return the row count."""
+    table = Path(member).stem.lower()  # e.g. 'agency.txt' → 'agency'
+
+    with zf.open(member) as fp:
+        reader = csv.reader(io.TextIOWrapper(fp, encoding="utf-8-sig", newline=""))
+        parsed = read_header_and_sample(reader, sample_rows)
+        if parsed is None:
+            print(f"    ⚠️  {member} is empty, skipping")
+            return 0
+        header, types, sample = parsed
+
+        insert_sql = create_table(cur, table, header, types)
+        cur.executemany(insert_sql, sample)
+        n_rows = len(sample)
+        for chunk in iter_row_chunks(reader, len(header), chunk_size):
+            cur.executemany(insert_sql, chunk)
+            n_rows += len(chunk)
+
+    return n_rows
 
-            # Build CREATE TABLE
-            columns_sql = ",\n  ".join(
-                f'"{c}" {sql_dtype(df[c].dtype)}' for c in df.columns
+
+def load_cached_table(cur, table: str, path: Path) -> int:
+    """Load one table from its columnar-cache file; return the row count."""
+    header, types, chunks = columnar_cache.read_batches(path)
+    insert_sql = create_table(cur, table, header, types)
+    n_rows = 0
+    for chunk in chunks:
+        cur.executemany(insert_sql, chunk)
+        n_rows += len(chunk)
+    return n_rows
+
+
+def parse_member_worker(zip_path: Path, member: str, queue,
+                        chunk_size: int, sample_rows: int) -> int:
+    """Process-pool task: decode and type-convert one member into `queue`.
+
+    Emits ("schema", table, (header, types)), then ("rows", table, chunk)
+    batches, and always finishes with ("done", table, n_rows | None).
+    """
+    table = Path(member).stem.lower()
+    n_rows = None
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf, zf.open(member) as fp:
+            reader = csv.reader(
+                io.TextIOWrapper(fp, encoding="utf-8-sig", newline="")
             )
-            ddl = f'CREATE TABLE IF NOT EXISTS "{table}" (\n  {columns_sql}\n);'
-            cur.execute(f'DROP TABLE IF EXISTS "{table}"')
-            cur.execute(ddl)
+            parsed = read_header_and_sample(reader, sample_rows)
+            if parsed is None:
+                n_rows = 0
+                return n_rows
+            header, types, sample = parsed
+
+            queue.put(("schema", table, (header, types)))
+            queue.put(("rows", table, convert_chunk(sample, types)))
+            n_rows = len(sample)
+            for chunk in iter_row_chunks(reader, len(header), chunk_size):
+                queue.put(("rows", table, convert_chunk(chunk, types)))
+                n_rows += len(chunk)
+        return n_rows
+    finally:
+        queue.put(("done", table, n_rows))
+
 
-            # Insert rows
-            df.to_sql(table, conn, if_exists="append", index=False)
+def drain_batches(cur, queue, errors: list):
+    """Writer thread: apply worker batches to SQLite until the "stop" sentinel.
 
-    conn.commit()
-    conn.close()
+    After the first write error the remaining batches are still consumed
+    (and discarded) so that no worker blocks on a full queue.
+    """
+    insert_sql, started = {}, {}
+    while True:
+        kind, table, payload = queue.get()
+        if kind == "stop":
+            return
+        if kind == "done":
+            if payload is None or errors or table not in started:
+                continue
+            elapsed = time.perf_counter() - started[table]
+            rate = payload / elapsed if elapsed > 0 else float(payload)
+            print(f"  • `{table}`: {payload:,} rows in {elapsed:.2f}s "
+                  f"({rate:,.0f} rows/s)")
+            continue
+        if errors:
+            continue
+        try:
+            if kind == "schema":
+                started[table] = time.perf_counter()
+                insert_sql[table] = create_table(cur, table, *payload)
+            else:
+                cur.executemany(insert_sql[table], payload)
+        except Exception as exc:  # surfaced by the main thread
+            errors.append(exc)
+
+
+def load_members_parallel(conn, zip_path: Path, txt_files, workers: int,
+                          chunk_size: int, sample_rows: int):
+    """Parse members in a process pool while one thread owns all SQLite writes."""
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        # Bounded so parsed-but-unwritten batches cannot pile up in memory
+        queue = manager.Queue(maxsize=workers * 2)
+        errors = []
+        writer = threading.Thread(
+            target=drain_batches,
+            args=(conn.cursor(), queue, errors),
+            name="sqlite-writer",
+        )
+        writer.start()
+        futures = [
+            pool.submit(parse_member_worker, zip_path, member, queue,
+                        chunk_size, sample_rows)
+            for member in txt_files
+        ]
+        for future in futures:
+            future.exception()  # wait; re-raised below after the writer stops
+        # Every worker's puts have landed by now, so the sentinel is last
+        queue.put(("stop", None, None))
+        writer.join()
+
+    for future in futures:
+        future.result()
+    if errors:
+        raise errors[0]
+
+
+def load_gtfs_zip(zip_path: Path, db_path: Path,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  sample_rows: int = DEFAULT_SAMPLE_ROWS,
+                  workers: int = 1,
+                  cache_dir: Path | None = CACHE_DIR,
+                  horizon_days: int = HORIZON_DAYS):
+    print(f"→ Opening GTFS archive: {zip_path}")
+    # An unchanged feed (same zip hash) is reloaded from the columnar cache
+    feed_key = (
+        file_hash(zip_path) if cache_dir and columnar_cache.available() else None
+    )
+    cached = columnar_cache.cached_feed(feed_key, cache_dir) if feed_key else None
+    # Autocommit mode so the whole load is one explicit transaction; the
+    # writer thread in --workers mode is the only user while it runs.
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf, ingest_pragmas(conn):
+            txt_files = [m for m in zf.namelist() if m.endswith(".txt")]
+            if not txt_files:
+                raise RuntimeError("No .txt files found in the zip!")
+            # Biggest members first so the pool isn't left waiting on stop_times
+            txt_files.sort(key=lambda m: zf.getinfo(m).file_size, reverse=True)
+            tables = [Path(t).stem.lower() for t in txt_files]
+
+            cur = conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                if cached:
+                    print(f"  • Unchanged feed: {len(cached)} tables from the columnar cache")
+                    for table, path in cached.items():
+                        started = time.perf_counter()
+                        n_rows = load_cached_table(cur, table, path)
+                        print(f"  • `{table}`: {n_rows:,} rows in "
+                              f"{time.perf_counter() - started:.2f}s")
+                elif workers > 1:
+                    print(f"  • Parsing {len(txt_files)} files with {workers} workers")
+                    started = time.perf_counter()
+                    load_members_parallel(conn, zip_path, txt_files, workers,
+                                          chunk_size, sample_rows)
+                    print(f"  • Parsed and written in "
+                          f"{time.perf_counter() - started:.2f}s")
+                else:
+                    for txt in txt_files:
+                        print(f"  • Loading {txt}  →  table "
+                              f"`{Path(txt).stem.lower()}`")
+                        started = time.perf_counter()
+                        n_rows = load_member(cur, zf, txt, chunk_size, sample_rows)
+                        elapsed = time.perf_counter() - started
+                        rate = n_rows / elapsed if elapsed > 0 else float(n_rows)
+                        print(f"    {n_rows:,} rows in {elapsed:.2f}s "
+                              f"({rate:,.0f} rows/s)")
+                # Derived tables (route rollups, stop/shape R*Trees, service days
+                # and block schedule) in the same transaction
+                refresh_rollups(conn, changed=tables)
+                refresh_spatial(conn, changed=tables)
+                refresh_schedule(conn, changed=tables, horizon_days=horizon_days)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        if feed_key and not cached:
+            try:
+                columnar_cache.write_feed(conn, feed_key, tables, cache_dir, chunk_size)
+                print(f"  • Cached {len(tables)} tables for feed {feed_key[:12]}")
+            except Exception as exc:   # the load itself already succeeded
+                print(f"  ⚠️  Could not write the columnar cache: {exc}")
+        # Post-ingest stage: join-key indexes + planner statistics
+        build_indexes(conn)
+    finally:
+        conn.close()
     print(f"✓ All GTFS tables imported into {db_path}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        sys.exit("Usage: python ingest_gtfs_to_sqlite.py <gtfs.zip> [sqlite_db]")
-    zip_file = Path(sys.argv[1]).expanduser().resolve()
+    parser = argparse.ArgumentParser(
+        description="Load every .txt file inside a GTFS zip into SQLite."
+    )
+    parser.add_argument("zip_file", help="GTFS zip archive")
+    parser.add_argument("sqlite_db", nargs="?",
+                        help="target database (default: vehicles.db next to the zip)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per executemany batch")
+    parser.add_argument("--sample-rows", type=int, default=DEFAULT_SAMPLE_ROWS,
+                        help="rows sampled per file to infer column types")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse files in N processes (one SQLite writer thread)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse the zip; don't read or write the columnar cache")
+    parser.add_argument("--horizon-days", type=int, default=HORIZON_DAYS,
+                        help="days ahead to expand active service_ids for")
+    args = parser.parse_args()
+
+    zip_file = Path(args.zip_file).expanduser().resolve()
     db_file = (
-        Path(sys.argv[2]).expanduser().resolve()
-        if len(sys.argv) > 2
+        Path(args.sqlite_db).expanduser().resolve()
+        if args.sqlite_db
         else zip_file.parent / "vehicles.db"
     )
-    load_gtfs_zip(zip_file, db_file)
+    load_gtfs_zip(zip_file, db_file, args.chunk_size, args.sample_rows, args.workers,
+                  cache_dir=None if args.no_cache else CACHE_DIR,
+                  horizon_days=args.horizon_days)
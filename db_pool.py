@@ -0,0 +1,85 @@
+"""
+db_pool.py – read-only SQLite engine for the Streamlit app.
+
+Every session, the agent's worker threads and deferred downloads check out
+their own connection from a QueuePool, so concurrent users no longer
+serialize on one shared sqlite3 connection (StaticPool).  Connections are
+opened with `mode=ro`, tuned for reads, pinned to `query_only`, and every
+statement runs under a deadline enforced by SQLite's progress handler, so a
+runaway query (e.g. an accidental cross join) is interrupted instead of
+tying up a connection indefinitely.
+"""
+import math
+import sqlite3
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+READ_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,   # bytes – map the DB instead of read() calls
+    "cache_size": -64 * 1024,          # KiB (negative) – 64 MiB page cache per connection
+    "temp_store": "MEMORY",            # sorts / GROUP BY temp tables stay in RAM
+}
+
+QUERY_TIMEOUT = 30          # seconds per statement (override with execution_options)
+PROGRESS_STEPS = 10_000     # VM instructions between deadline checks
+POOL_SIZE = 8               # connections kept open
+MAX_OVERFLOW = 16           # extra connections under load, closed when returned
+
+
+class _Deadline:
+    """Per-connection deadline checked by the SQLite progress handler."""
+
+    def __init__(self):
+        self.at = None
+
+    def expired(self) -> bool:
+        # A true return value makes SQLite abort with "interrupted"
+        return self.at is not None and time.monotonic() > self.at
+
+
+def readonly_engine(db_path, query_timeout: float = QUERY_TIMEOUT,
+                    pool_size: int = POOL_SIZE, max_overflow: int = MAX_OVERFLOW):
+    """SQLAlchemy engine over a pool of read-only, query-only connections.
+
+    Per-statement timeout: `conn.execution_options(query_timeout=seconds)`,
+    or None to disable it (e.g. for long streamed exports).
+    """
+    uri = f"file:{db_path}?mode=ro"
+    engine = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=30,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        for name, value in READ_PRAGMAS.items():
+            dbapi_conn.execute(f"PRAGMA {name} = {value}")
+        deadline = _Deadline()
+        dbapi_conn.set_progress_handler(deadline.expired, PROGRESS_STEPS)
+        record.info["deadline"] = deadline
+        # Distances over the *_geo views use sqrt(); not every SQLite build has it
+        try:
+            dbapi_conn.execute("SELECT sqrt(1)")
+        except sqlite3.OperationalError:
+            dbapi_conn.create_function("sqrt", 1, math.sqrt, deterministic=True)
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        record.info["deadline"].at = None
+        # Re-asserted on every checkout: nothing handed out can write
+        dbapi_conn.execute("PRAGMA query_only = 1")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_deadline(conn, cursor, statement, parameters, context, executemany):
+        timeout = conn.get_execution_options().get("query_timeout", query_timeout)
+        deadline = conn.connection.info.get("deadline")
+        if deadline is not None:
+            deadline.at = time.monotonic() + timeout if timeout else None
+
+    return engine
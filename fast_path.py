@@ -0,0 +1,210 @@
+"""
+fast_path.py – deterministic router for the canonical dispatch questions.
+
+The questions in `modular_prompt/examples.md` / `business_rules.md`
+(in-service status, current and end-of-block SOC, dispatch suggestions,
+energy efficiency, nearest bus to a stop, today's block schedule, bus
+type) map onto fixed SQL.
+When a question matches one of these templates and its tables exist, the
+app runs the parameterized query directly and never calls the LLM;
+anything else falls through to the LangChain agent.  Parameters that
+don't come from the question (`Route.context`, e.g. today's service date
+in the agency's timezone) are supplied by the caller.
+"""
+import re
+from dataclasses import dataclass
+
+# In-service per business_rules.md: a non-blank block_id that exists in GTFS
+_IN_SERVICE = (
+    "block_id IS NOT NULL AND TRIM(block_id) NOT IN ('', 'N/A') "
+    "AND block_id IN (SELECT block_id FROM trips)"
+)
+
+_BUS = r"\bbus\s*(?:id\s*)?#?\s*(?P<bus_id>\d+)\b"
+_BLOCK = r"\bblock\s*(?:id\s*)?#?\s*(?P<block_id>\w*\d\w*)\b"
+_DATE = r"\b(?P<record_date>\d{4}-\d{2}-\d{2})\b"
+_DRIVER = r"\bdriver\s*(?:id\s*)?#?\s*(?P<driver_id>\d+)\b"
+_EFFICIENCY = r"\b(?:energy\s+efficiency|kwh\s*(?:/|per)\s*mile)\b"
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    pattern: re.Pattern
+    sql: str
+    tables: tuple
+    empty_reply: str
+    context: tuple = ()   # bound params taken from the caller's context
+
+
+def _route(name, lookaheads, sql, tables, empty_reply, context=()):
+    """Order-independent matcher: every lookahead must appear in the question."""
+    pattern = re.compile("^" + "".join(f"(?=.*{la})" for la in lookaheads), re.I | re.S)
+    return Route(name, pattern, " ".join(sql.split()), tuple(tables), empty_reply, tuple(context))
+
+
+# Most specific first: the first matching route wins
+ROUTES = [
+    _route(
+        "in_service",
+        [_BUS, r"\bin[\s-]?service\b"],
+        # The bus's latest report decides, not its latest in-service one
+        f"""WITH latest AS (
+                SELECT bus_id, block_id, trip_id, tmstmp FROM realtime_cad_avl_data
+                WHERE bus_id = :bus_id ORDER BY tmstmp DESC LIMIT 1)
+            SELECT bus_id, block_id, trip_id, tmstmp FROM latest WHERE {_IN_SERVICE}""",
+        ["realtime_cad_avl_data", "trips"],
+        "Bus {bus_id} is not inservice.",
+    ),
+    _route(
+        "end_of_block_soc",
+        [_BUS, r"\bsoc\b", r"\bend[\s-]of[\s-](?:the\s+)?(?:current\s+)?block\b"],
+        """SELECT bus_id, block_id, timestamp, pred_end_block_soc
+           FROM realtime_forecast_of_inservice_bus_soc
+           WHERE bus_id = :bus_id AND pred_end_block_soc IS NOT NULL
+           ORDER BY timestamp DESC LIMIT 1""",
+        ["realtime_forecast_of_inservice_bus_soc"],
+        "There is no prediction data for bus {bus_id}.",
+    ),
+    _route(
+        "current_soc",
+        [_BUS, r"\b(?:current|real[\s-]?time|latest)\s+soc\b"],
+        """SELECT bus_id, current_soc FROM realtime_ev_telematics
+           WHERE bus_id = :bus_id AND current_soc IS NOT NULL""",
+        ["realtime_ev_telematics"],
+        "There is no SOC data for bus {bus_id}.",
+    ),
+    _route(
+        "dispatch_suggestion",
+        [_BLOCK, r"\b(?:which|what)\s+bus(?:es)?\b", r"\b(?:serve|assign|dispatch|cover)\b"],
+        f"""SELECT bus_id, block_id, end_soc FROM candidates_bus_block_end_soc
+            WHERE block_id = :block_id AND end_soc IS NOT NULL
+              AND bus_id NOT IN (
+                  SELECT bus_id FROM (
+                      SELECT bus_id, block_id, ROW_NUMBER() OVER (
+                          PARTITION BY bus_id ORDER BY tmstmp DESC) AS n
+                      FROM realtime_cad_avl_data WHERE bus_id IS NOT NULL)
+                  WHERE n = 1 AND {_IN_SERVICE})
+            ORDER BY end_soc DESC""",
+        ["candidates_bus_block_end_soc", "realtime_cad_avl_data", "trips"],
+        "There is no suggested prediction data for block {block_id}.",
+    ),
+    _route(
+        "bus_block_day_efficiency",
+        [_EFFICIENCY, _BUS, _BLOCK, _DATE],
+        """SELECT bus_id, block_id, record_date, kwh_per_mile
+           FROM historical_inservice_block_statistics
+           WHERE bus_id = :bus_id AND block_id = :block_id
+             AND record_date = :record_date AND kwh_per_mile IS NOT NULL""",
+        ["historical_inservice_block_statistics"],
+        "There is no historical data for bus {bus_id} on block {block_id} on {record_date}.",
+    ),
+    _route(
+        "bus_block_efficiency",
+        [_EFFICIENCY, _BUS, _BLOCK],
+        """SELECT bus_id, block_id, AVG(kwh_per_mile) AS avg_kwh_per_mile,
+                  COUNT(*) AS records
+           FROM historical_inservice_block_statistics
+           WHERE bus_id = :bus_id AND block_id = :block_id AND kwh_per_mile IS NOT NULL
+           GROUP BY bus_id, block_id""",
+        ["historical_inservice_block_statistics"],
+        "There is no historical data for bus {bus_id} on block {block_id}.",
+    ),
+    # Precomputed averages (rollups.py) first; the aggregates below are the
+    # fallback for databases built before the rollup stage existed
+    _route(
+        "driver_efficiency",
+        [_EFFICIENCY, _DRIVER],
+        """SELECT driver_id, avg_kwh_per_mile, kwh_per_mile_n AS trips
+           FROM rollup_driver_efficiency
+           WHERE driver_id = :driver_id AND kwh_per_mile_n > 0""",
+        ["rollup_driver_efficiency"],
+        "There is no historical data for driver {driver_id}.",
+    ),
+    _route(
+        "bus_efficiency",
+        [_EFFICIENCY, _BUS, r"\b(?:average|avg|historical)\b"],
+        """SELECT bus_id, avg_kwh_per_mile, kwh_per_mile_n AS records
+           FROM rollup_bus_efficiency
+           WHERE bus_id = :bus_id AND kwh_per_mile_n > 0""",
+        ["rollup_bus_efficiency"],
+        "There is no historical data for bus {bus_id}.",
+    ),
+    _route(
+        "driver_efficiency",
+        [_EFFICIENCY, _DRIVER],
+        """SELECT driver_id, AVG(kwh_per_mile) AS avg_kwh_per_mile, COUNT(*) AS trips
+           FROM historical_inservice_trip_statistics
+           WHERE driver_id = :driver_id AND kwh_per_mile IS NOT NULL
+           GROUP BY driver_id""",
+        ["historical_inservice_trip_statistics"],
+        "There is no historical data for driver {driver_id}.",
+    ),
+    _route(
+        "bus_efficiency",
+        [_EFFICIENCY, _BUS, r"\b(?:average|avg|historical)\b"],
+        """SELECT bus_id, AVG(kwh_per_mile) AS avg_kwh_per_mile, COUNT(*) AS records
+           FROM historical_inservice_block_statistics
+           WHERE bus_id = :bus_id AND kwh_per_mile IS NOT NULL
+           GROUP BY bus_id""",
+        ["historical_inservice_block_statistics"],
+        "There is no historical data for bus {bus_id}.",
+    ),
+    _route(
+        "nearest_bus_to_stop",
+        [r"\b(?:closest|nearest)\b", r"\bbus(?:es)?\b",
+         r"\bstop\s*(?:id\s*)?#?\s*(?P<stop_id>\w*\d\w*)\b"],
+        # R*Tree box of ±0.05° (~3.5 miles) around the stop, then exact ranking
+        f"""SELECT v.bus_id, v.block_id, v.tmstmp, v.lat, v.lon,
+                   ROUND(ref.miles_per_degree * sqrt(
+                       (v.lat - s.lat) * (v.lat - s.lat)
+                       + (v.lon - s.lon) * ref.lon_scale * (v.lon - s.lon) * ref.lon_scale
+                   ), 2) AS distance_miles
+            FROM stops_geo AS s, spatial_ref AS ref, vehicle_positions_geo AS v
+            WHERE s.stop_id = :stop_id
+              AND v.lat BETWEEN s.lat - 0.05 AND s.lat + 0.05
+              AND v.lon BETWEEN s.lon - 0.05 AND s.lon + 0.05
+              AND {_IN_SERVICE}
+            ORDER BY distance_miles LIMIT 5""",
+        ["stops_geo", "spatial_ref", "vehicle_positions_geo", "trips"],
+        "There is no in-service bus within about 3 miles of stop {stop_id}.",
+    ),
+    _route(
+        "block_schedule_today",
+        [_BLOCK, r"\b(?:when|what\s+time|schedule[sd]?|start|end|finish)\b",
+         r"\b(?:today|tonight)\b"],
+        # service_days / block_schedule (gtfs_schedule.py) resolve the calendar;
+        # :service_date is today in the agency's timezone (gtfs_schedule.service_today)
+        """SELECT block_id, service_date, service_id, start_time, end_time,
+                  first_stop_id, last_stop_id, trips, scheduled_miles
+           FROM blocks_by_day
+           WHERE block_id = :block_id AND service_date = :service_date""",
+        ["blocks_by_day"],
+        "Block {block_id} is not scheduled today.",
+        context=["service_date"],
+    ),
+    _route(
+        "bus_type",
+        [r"\bwhat\b", r"\b(?:type|kind|model|make)\b",
+         r"\bbus\s+(?:is\s+)?#?\s*(?P<bus_id>\d+)\b"],
+        "SELECT * FROM bus_specifications WHERE bus_id = :bus_id",
+        ["bus_specifications"],
+        "There is no specification data for bus {bus_id}.",
+    ),
+]
+
+
+def match_route(question: str, available_tables, context=None) -> tuple[Route, dict] | None:
+    """Return (route, params) for the first template that fits, else None.
+
+    `context` maps the names in `Route.context` to their values; a route
+    whose context is missing is skipped like one whose tables are missing.
+    """
+    available = set(available_tables)
+    context = context or {}
+    for route in ROUTES:
+        match = route.pattern.search(question)
+        if not match or not set(route.tables) <= available or not set(route.context) <= context.keys():
+            continue
+        return route, {**match.groupdict(), **{name: context[name] for name in route.context}}
+    return None
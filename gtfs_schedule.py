@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""
+gtfs_schedule.py  ────────────────────────────────────────────────────────
+Materialized GTFS timetable tables, so "which blocks run on <date> and
+when do they start / end" is a lookup instead of a calendar + trips +
+stop_times join written by the agent.
+
+Usage:  python gtfs_schedule.py [sqlite_db] [--horizon-days N]
+
+    service_days    service_date (YYYY-MM-DD), date (YYYYMMDD), weekday,
+                    service_id: every active service_id per date
+    block_schedule  one row per (block_id, service_id): trips, routes,
+                    start/end time (HH:MM:SS, may pass 24:00:00) and
+                    seconds past midnight, first/last trip and stop,
+                    scheduled_miles (sum of the trips' shape lengths)
+    blocks_by_day   view: block_schedule for each service_date
+    _service_window first_date / last_date service_days was expanded for
+
+Active service follows GTFS: the calendar weekday flags within
+start_date..end_date, plus calendar_dates exception_type 1 (added), minus
+exception_type 2 (removed).  Dates are expanded from PAST_DAYS before to
+`horizon_days` after today (but not past the feed's last date), where
+today is the date in the agency's timezone (`service_today`), clamped
+into the feed's validity so an expired or future feed still gets a
+window.  Runs as a post-load stage of both loaders; block_schedule is
+rebuilt when trips, stop_times or shapes change, service_days also when
+the window it was built for runs short.
+"""
+import argparse
+import math
+import sqlite3
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+HORIZON_DAYS = 60        # days after today to expand service for
+PAST_DAYS = 14           # days before today (yesterday's / last week's blocks)
+EARTH_RADIUS_MILES = 3958.8
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+WINDOW_TABLE = "_service_window"
+
+SERVICE_INPUTS = {"calendar", "calendar_dates"}
+BLOCK_INPUTS = {"trips", "stop_times", "shapes"}
+
+
+def _objects(conn, kind: str) -> set[str]:
+    return {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))
+    }
+
+
+def _columns(conn, table: str) -> dict[str, str]:
+    return {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _gtfs_date(value) -> date:
+    return datetime.strptime(str(value), "%Y%m%d").date()
+
+
+def _secs_sql(column: str) -> str:
+    """HH:MM:SS (or H:MM:SS, hours may exceed 24) → seconds past midnight."""
+    return (
+        f"(CAST(substr({column}, 1, instr({column}, ':') - 1) AS INTEGER) * 3600"
+        f" + CAST(substr({column}, instr({column}, ':') + 1, 2) AS INTEGER) * 60"
+        f" + CAST(substr({column}, -2) AS INTEGER))"
+    )
+
+
+###############################################################################
+# ---------- service_days -----------------------------------------------------
+###############################################################################
+def agency_timezone(conn) -> str | None:
+    """The feed's agency_timezone (GTFS dates are in this zone), if loaded."""
+    if "agency_timezone" not in _columns(conn, "agency"):
+        return None
+    row = conn.execute(
+        "SELECT agency_timezone FROM agency WHERE TRIM(agency_timezone) != '' LIMIT 1"
+    ).fetchone()
+    return row[0].strip() if row else None
+
+
+def service_today(timezone: str | None = None) -> date:
+    """Today in the agency's timezone (the server's local date if unknown)."""
+    try:
+        return datetime.now(ZoneInfo(timezone)).date() if timezone else date.today()
+    except (ZoneInfoNotFoundError, ValueError):
+        return date.today()
+
+
+def service_window(conn, horizon_days: int = HORIZON_DAYS, today: date | None = None):
+    """(first, last) date to expand: around today, clamped into the feed's validity."""
+    today = today or service_today(agency_timezone(conn))
+    bounds = []
+    if "calendar" in _objects(conn, "table"):
+        bounds += conn.execute("SELECT MIN(start_date), MAX(end_date) FROM calendar").fetchone()
+    if "calendar_dates" in _objects(conn, "table"):
+        bounds += conn.execute("SELECT MIN(date), MAX(date) FROM calendar_dates").fetchone()
+    bounds = [_gtfs_date(b) for b in bounds if b is not None]
+    last = today + timedelta(days=horizon_days)
+    if bounds:
+        today = min(max(today, min(bounds)), max(bounds))
+        last = min(today + timedelta(days=horizon_days), max(bounds))
+    return today - timedelta(days=PAST_DAYS), last
+
+
+def build_service_days(conn, horizon_days: int = HORIZON_DAYS, today: date | None = None) -> int:
+    first, last = service_window(conn, horizon_days, today)
+    tables = _objects(conn, "table")
+    active = set()   # (date, service_id)
+
+    if "calendar" in tables:
+        flags = [d for d in WEEKDAYS if d in _columns(conn, "calendar")]
+        rows = conn.execute(
+            f"SELECT service_id, start_date, end_date, {', '.join(flags)} FROM calendar"
+        ).fetchall()
+        for service_id, start, end, *days in rows:
+            running = {WEEKDAYS.index(d) for d, on in zip(flags, days) if str(on) == "1"}
+            day = max(first, _gtfs_date(start))
+            while day <= min(last, _gtfs_date(end)):
+                if day.weekday() in running:
+                    active.add((day, service_id))
+                day += timedelta(days=1)
+
+    if "calendar_dates" in tables:
+        for service_id, day, exception_type in conn.execute(
+            "SELECT service_id, date, exception_type FROM calendar_dates"
+        ):
+            day = _gtfs_date(day)
+            if not first <= day <= last:
+                continue
+            if str(exception_type) == "1":
+                active.add((day, service_id))
+            elif str(exception_type) == "2":
+                active.discard((day, service_id))
+
+    # service_id keeps the declared type of the GTFS column it joins to
+    service_type = (
+        _columns(conn, "trips").get("service_id")
+        or _columns(conn, "calendar").get("service_id", "")
+    )
+    conn.execute("DROP TABLE IF EXISTS service_days")
+    conn.execute(
+        "CREATE TABLE service_days (service_date TEXT, date INTEGER, weekday TEXT,"
+        f" service_id {service_type}, PRIMARY KEY (service_date, service_id))"
+    )
+    conn.executemany(
+        "INSERT INTO service_days VALUES (?, ?, ?, ?)",
+        (
+            (day.isoformat(), int(day.strftime("%Y%m%d")), WEEKDAYS[day.weekday()], service_id)
+            for day, service_id in sorted(active, key=lambda a: (a[0], str(a[1])))
+        ),
+    )
+    # The window itself: the last days may have no service, so MAX(service_date) can't tell
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{WINDOW_TABLE}" (first_date TEXT, last_date TEXT)')
+    conn.execute(f'DELETE FROM "{WINDOW_TABLE}"')
+    conn.execute(f'INSERT INTO "{WINDOW_TABLE}" VALUES (?, ?)', (first.isoformat(), last.isoformat()))
+    return len(active)
+
+
+###############################################################################
+# ---------- block_schedule ---------------------------------------------------
+###############################################################################
+def _shape_miles(conn) -> dict:
+    """Great-circle length of every shape, in miles (unit-safe, unlike shape_dist_traveled)."""
+    lengths = {}
+    previous = (None, None, None)
+    for shape_id, lat, lon in conn.execute(
+        "SELECT shape_id, shape_pt_lat, shape_pt_lon FROM shapes"
+        " WHERE shape_pt_lat IS NOT NULL AND shape_pt_lon IS NOT NULL"
+        " ORDER BY shape_id, shape_pt_sequence"
+    ):
+        prev_shape, prev_lat, prev_lon = previous
+        if shape_id == prev_shape:
+            phi1, phi2 = math.radians(prev_lat), math.radians(lat)
+            a = (
+                math.sin((phi2 - phi1) / 2) ** 2
+                + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon - prev_lon) / 2) ** 2
+            )
+            lengths[shape_id] += 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+        else:
+            lengths[shape_id] = 0.0
+        previous = (shape_id, lat, lon)
+    return lengths
+
+
+def build_block_schedule(conn) -> int:
+    tables = _objects(conn, "table")
+    trip_cols = _columns(conn, "trips")
+
+    # Per trip: first / last timed stop (one pass each over stop_times)
+    conn.execute("DROP TABLE IF EXISTS temp.trip_ends")
+    conn.execute(
+        "CREATE TEMP TABLE trip_ends AS SELECT f.trip_id, f.start_secs, f.first_stop_id,"
+        " l.end_secs, l.last_stop_id FROM"
+        f" (SELECT trip_id, MIN(stop_sequence), {_secs_sql('departure_time')} AS start_secs,"
+        "   stop_id AS first_stop_id FROM stop_times"
+        "   WHERE departure_time IS NOT NULL AND departure_time != '' GROUP BY trip_id) AS f"
+        " JOIN"
+        f" (SELECT trip_id, MAX(stop_sequence), {_secs_sql('arrival_time')} AS end_secs,"
+        "   stop_id AS last_stop_id FROM stop_times"
+        "   WHERE arrival_time IS NOT NULL AND arrival_time != '' GROUP BY trip_id) AS l"
+        " USING (trip_id)"
+    )
+    conn.execute("CREATE INDEX temp.idx_trip_ends__trip_id ON trip_ends (trip_id)")
+
+    conn.execute("DROP TABLE IF EXISTS temp.shape_miles")
+    conn.execute("CREATE TEMP TABLE shape_miles (shape_id PRIMARY KEY, miles REAL)")
+    if "shapes" in tables and "shape_id" in trip_cols:
+        conn.executemany("INSERT INTO shape_miles VALUES (?, ?)", _shape_miles(conn).items())
+    shape_join = (
+        "LEFT JOIN shape_miles AS m ON m.shape_id = t.shape_id" if "shape_id" in trip_cols
+        else "LEFT JOIN shape_miles AS m ON 0"
+    )
+    route = "t.route_id" if "route_id" in trip_cols else "NULL"
+
+    block_type = trip_cols.get("block_id", "")
+    service_type = trip_cols.get("service_id", "")
+    conn.execute("DROP TABLE IF EXISTS block_schedule")
+    conn.execute(
+        f"CREATE TABLE block_schedule (block_id {block_type}, service_id {service_type},"
+        " trips INTEGER, route_ids TEXT, start_time TEXT, end_time TEXT,"
+        " start_secs INTEGER, end_secs INTEGER, first_trip_id, last_trip_id,"
+        " first_stop_id, last_stop_id, scheduled_miles REAL,"
+        " PRIMARY KEY (block_id, service_id))"
+    )
+    # Trips of a block in time order; first / last rows give the block's ends
+    conn.execute(
+        "INSERT INTO block_schedule"
+        " WITH ordered AS ("
+        f"   SELECT t.block_id, t.service_id, t.trip_id, {route} AS route_id, m.miles,"
+        "     e.start_secs, e.end_secs, e.first_stop_id, e.last_stop_id,"
+        "     ROW_NUMBER() OVER w_first AS n_first, ROW_NUMBER() OVER w_last AS n_last"
+        "   FROM trips AS t JOIN trip_ends AS e ON e.trip_id = t.trip_id"
+        f"   {shape_join}"
+        "   WHERE t.block_id IS NOT NULL AND TRIM(t.block_id) != ''"
+        "   WINDOW w_first AS (PARTITION BY t.block_id, t.service_id ORDER BY e.start_secs),"
+        "          w_last AS (PARTITION BY t.block_id, t.service_id ORDER BY e.end_secs DESC))"
+        " SELECT block_id, service_id, COUNT(*), GROUP_CONCAT(DISTINCT route_id),"
+        "   printf('%02d:%02d:%02d', MIN(start_secs) / 3600, MIN(start_secs) / 60 % 60,"
+        "          MIN(start_secs) % 60),"
+        "   printf('%02d:%02d:%02d', MAX(end_secs) / 3600, MAX(end_secs) / 60 % 60,"
+        "          MAX(end_secs) % 60),"
+        "   MIN(start_secs), MAX(end_secs),"
+        "   MAX(CASE WHEN n_first = 1 THEN trip_id END), MAX(CASE WHEN n_last = 1 THEN trip_id END),"
+        "   MAX(CASE WHEN n_first = 1 THEN first_stop_id END),"
+        "   MAX(CASE WHEN n_last = 1 THEN last_stop_id END),"
+        "   ROUND(SUM(miles), 2)"
+        " FROM ordered GROUP BY block_id, service_id"
+    )
+    conn.execute("DROP TABLE temp.trip_ends")
+    conn.execute("DROP TABLE temp.shape_miles")
+    return conn.execute("SELECT COUNT(*) FROM block_schedule").fetchone()[0]
+
+
+def _create_view(conn):
+    conn.execute("DROP VIEW IF EXISTS blocks_by_day")
+    conn.execute(
+        "CREATE VIEW blocks_by_day AS SELECT d.service_date, d.weekday, b.*"
+        " FROM service_days AS d JOIN block_schedule AS b ON b.service_id = d.service_id"
+    )
+
+
+def refresh_schedule(conn: sqlite3.Connection, changed=(),
+                     horizon_days: int = HORIZON_DAYS) -> list[str]:
+    """Rebuild service_days / block_schedule when their inputs changed; return what was rebuilt."""
+    tables = _objects(conn, "table")
+    changed = set(changed)
+    rebuilt = []
+
+    if SERVICE_INPUTS & tables and "trips" in tables:
+        needed = service_window(conn, horizon_days)[1].isoformat()
+        stale = (
+            not {"service_days", WINDOW_TABLE} <= tables
+            or SERVICE_INPUTS & changed
+            or (conn.execute(f'SELECT MAX(last_date) FROM "{WINDOW_TABLE}"').fetchone()[0] or "")
+            < needed
+        )
+        if stale:
+            build_service_days(conn, horizon_days)
+            rebuilt.append("service_days")
+
+    trip_cols = _columns(conn, "trips") if "trips" in tables else {}
+    if (
+        {"block_id", "service_id"} <= set(trip_cols)
+        and "stop_times" in tables
+        and ("block_schedule" not in tables or BLOCK_INPUTS & changed)
+    ):
+        build_block_schedule(conn)
+        rebuilt.append("block_schedule")
+
+    if rebuilt and {"service_days", "block_schedule"} <= _objects(conn, "table"):
+        _create_view(conn)
+    if rebuilt:
+        print(f"📅 Rebuilt {', '.join(rebuilt)}")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand GTFS service days and block schedules.")
+    parser.add_argument("sqlite_db", nargs="?", default="vehicles.db")
+    parser.add_argument("--horizon-days", type=int, default=HORIZON_DAYS,
+                        help="days after today to expand active service for")
+    args = parser.parse_args()
+    db_file = Path(args.sqlite_db)
+    if not db_file.exists():
+        raise SystemExit(f"Database file not found at: {db_file}")
+    with sqlite3.connect(db_file) as connection:
+        refresh_schedule(connection, changed=SERVICE_INPUTS | BLOCK_INPUTS,
+                         horizon_days=args.horizon_days)
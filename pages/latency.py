@@ -0,0 +1,66 @@
+###############################################################################
+# latency.py – admin page: where does the time per question go?             #
+###############################################################################
+import time
+
+import streamlit as st
+
+# Streamlit puts the main script's folder (the repo root) on sys.path
+from tracing import RETENTION_DAYS, TraceSink, latency_summary
+
+st.set_page_config(page_title="Latency • Vehicles DB", page_icon="⏱️")
+st.title("⏱️ Question latency")
+
+# Admin-only: traces include user questions, so no ADMIN_PASSWORD means no page
+try:
+    admin_password = st.secrets.get("ADMIN_PASSWORD", "")
+except FileNotFoundError:   # no secrets.toml at all
+    admin_password = ""
+if not admin_password:
+    st.info("Latency page not configured: set ADMIN_PASSWORD in Streamlit secrets to enable it.")
+    st.stop()
+if st.sidebar.text_input("🔐 Admin password", type="password") != admin_password:
+    st.warning("Enter the admin password to see latency traces.")
+    st.stop()
+
+days = st.sidebar.slider("Window (days)", 1, RETENTION_DAYS, 7)
+spans = TraceSink().load(since=time.time() - days * 86400)
+if spans.empty:
+    st.info("No traces recorded yet. Ask the chat a question first.")
+    st.stop()
+
+questions = spans[spans["kind"] == "question"]
+
+# ---------- Per question: end-to-end time by answer path ---------------------
+st.subheader("Per question")
+col1, col2, col3 = st.columns(3)
+col1.metric("Questions", f"{len(questions):,}")
+col2.metric("p50 (s)", f"{questions['duration_ms'].quantile(0.5) / 1000:.1f}")
+col3.metric("p95 (s)", f"{questions['duration_ms'].quantile(0.95) / 1000:.1f}")
+st.dataframe(latency_summary(questions).drop(columns=["kind"]), hide_index=True)
+
+# ---------- Where the agent's time goes --------------------------------------
+st.subheader("Breakdown by LLM call, tool and SQL")
+st.dataframe(latency_summary(spans[spans["kind"] != "question"]), hide_index=True)
+
+agent_questions = questions[questions["name"] == "agent"]
+if not agent_questions.empty:
+    per_trace = spans[spans["trace_id"].isin(agent_questions["trace_id"])]
+    share = (
+        per_trace[per_trace["kind"] != "question"]
+        .groupby(["trace_id", "kind"])["duration_ms"].sum()
+        .unstack(fill_value=0)
+        .join(agent_questions.set_index("trace_id")[["duration_ms", "steps"]])
+    )
+    st.caption(
+        f"Agent answers: median {share['steps'].median():.0f} LLM calls per question; "
+        "median ms spent per kind of work below."
+    )
+    st.dataframe(share.median().round(0).rename("median_ms").to_frame())
+
+# ---------- Slowest recent questions -----------------------------------------
+st.subheader("Slowest questions")
+slowest = questions.nlargest(20, "duration_ms")[
+    ["question", "name", "duration_ms", "steps", "error"]
+]
+st.dataframe(slowest, hide_index=True)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+prompt_bundle.py – precompiled system prompt and schema summary for fast starts.
+
+Streamlit re-executes the app script on every rerun, and every new
+replica starts cold.  Instead of re-reading and ASCII-normalising every
+`modular_prompt/` file and re-parsing the table heuristics each time, the
+results are compiled once into small JSON files keyed by content hashes:
+
+    .prompt_bundle/prompt-<hash of the modular_prompt/ files>.json
+        full system prompt, its hash (the answer-cache key) and the
+        parsed PromptPruner state
+    .prompt_bundle/schema-<schema fingerprint>.json
+        `get_table_info` of every table (DDL + sample rows) for the agent
+
+Editing a prompt file or changing the schema changes the key, so a stale
+bundle is never read.  Bake them into the image with
+
+    python prompt_bundle.py [sqlite_db]
+"""
+import hashlib
+import json
+import os
+import sys
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+
+from answer_cache import schema_fingerprint, text_hash
+from schema_context import PromptPruner
+
+PROMPT_DIR = Path(__file__).parent / "modular_prompt"
+BUNDLE_DIR = Path(__file__).parent / ".prompt_bundle"
+BUNDLE_VERSION = 1       # bump when the bundled state's layout changes
+MAX_BUNDLES = 8          # files of each kind kept on disk
+
+
+@dataclass(frozen=True)
+class PromptBundle:
+    key: str
+    system_prompt: str
+    prompt_hash: str
+    pruner: PromptPruner
+
+
+def ascii_clean(text: str) -> str:
+    """Remove problematic unicode characters from prompts."""
+    return (
+        unicodedata.normalize("NFKD", text)
+        .encode("ascii", errors="ignore")
+        .decode("ascii")
+    )
+
+
+def prompt_key(folder: Path = PROMPT_DIR) -> str:
+    """Hash of every prompt file's name and bytes (cheap enough for every rerun)."""
+    digest = hashlib.sha256(f"v{BUNDLE_VERSION}".encode())
+    for path in sorted(Path(folder).glob("*.*")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _read(path: Path) -> dict | None:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: Path, payload: dict):
+    """Atomic write (concurrent replicas may share the folder), then prune."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.{os.getpid()}.part")
+        partial.write_text(json.dumps(payload))
+        os.replace(partial, path)
+        same_kind = sorted(
+            path.parent.glob(f"{path.name.split('-')[0]}-*.json"),
+            key=lambda p: p.stat().st_mtime, reverse=True,
+        )
+        for stale in same_kind[MAX_BUNDLES:]:
+            stale.unlink(missing_ok=True)
+    except OSError:   # read-only image: just compile again next start
+        pass
+
+
+def load_prompt_bundle(folder: Path = PROMPT_DIR, key: str | None = None,
+                       bundle_dir: Path = BUNDLE_DIR) -> PromptBundle:
+    """The compiled prompt for the current prompt files, building it if needed."""
+    key = key or prompt_key(folder)
+    path = Path(bundle_dir) / f"prompt-{key[:32]}.json"
+    state = _read(path)
+    if state is not None and state.get("key") == key:
+        pruner = PromptPruner.from_state(state["pruner"])
+    else:
+        pruner = PromptPruner(folder, clean=ascii_clean)
+        _write(path, {"key": key, "pruner": pruner.state()})
+    return PromptBundle(key, pruner.full_prompt, text_hash(pruner.full_prompt), pruner)
+
+
+def load_table_info(fingerprint: str, bundle_dir: Path = BUNDLE_DIR) -> dict | None:
+    """Cached schema summary for a schema fingerprint (see answer_cache.schema_fingerprint)."""
+    return _read(Path(bundle_dir) / f"schema-{fingerprint[:32]}.json")
+
+
+def store_table_info(fingerprint: str, table_info: dict, bundle_dir: Path = BUNDLE_DIR):
+    _write(Path(bundle_dir) / f"schema-{fingerprint[:32]}.json", table_info)
+
+
+if __name__ == "__main__":
+    bundle = load_prompt_bundle()
+    print(f"🧩 Prompt bundle {bundle.key[:12]}: {len(bundle.system_prompt):,} chars")
+    db_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "vehicles.db"
+    if db_file.exists():
+        from agent_stack import build_sql_database
+        from query_cache import QueryCache
+
+        fingerprint = schema_fingerprint(db_file)
+        table_info = build_sql_database(db_file, QueryCache()).snapshot_table_info()
+        store_table_info(fingerprint, table_info)
+        print(f"🧩 Schema bundle {fingerprint[:12]}: {len(table_info)} tables")
@@ -0,0 +1,216 @@
+"""
+query_cache.py – result cache for the agent's `sql_db_query` tool.
+
+Results are keyed on the normalized SQL text plus the DB generation (see
+`db_generation` in streamlit_app.py), evicted LRU-first, and expire after
+a short TTL when they touch realtime tables or a long one otherwise.
+
+The tool also hands the LLM at most PREVIEW_ROWS rows; the UI re-runs the
+agent's final SQL itself and pages through the full result (result_pager.py).
+With a QueryGuard attached, too-expensive plans are rejected with feedback
+before they run (query_guard.py).  The rows the tool fetched are also
+kept as a small DataFrame per query (`preview_frame`), so the UI can show
+them while the agent is still answering without running the SQL again.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from langchain_community.utilities import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy import text
+
+from result_pager import ResultPager
+
+# Tables refreshed every minute by `sqlite.py --incremental`
+REALTIME_TABLE_PATTERN = re.compile(r"\b(realtime_\w+|candidates_bus_block_end_soc)\b", re.I)
+
+REALTIME_TTL = 30          # seconds
+STATIC_TTL = 60 * 60       # seconds – GTFS / specs / history
+MAX_ENTRIES = 512
+PREVIEW_ROWS = 50          # rows of a query result the LLM gets to see
+MAX_FRAMES = 16            # recent tool results kept as DataFrames for the UI
+
+
+def extract_raw_sql(text: str) -> str:
+    """Extracts the raw SQL query from markdown-fenced output, or returns raw."""
+    match = re.search(r"```sql\s+(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return match.group(1).strip() if match else text.strip()
+
+
+def normalize_sql(text: str) -> str:
+    """Canonical form of a query for cache keys.
+
+    Strips markdown fences and trailing semicolons, collapses whitespace and
+    case-folds everything except quoted literals ('BEV' ≠ 'bev').
+    """
+    sql = extract_raw_sql(text).rstrip("; \n\t")
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", sql)
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part).lower()
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def ttl_for(sql: str) -> int:
+    """Short TTL for queries touching realtime tables, long TTL otherwise."""
+    return REALTIME_TTL if REALTIME_TABLE_PATTERN.search(sql) else STATIC_TTL
+
+
+class QueryCache:
+    """Thread-safe LRU + TTL cache with hit/miss counters."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key → (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase whose string-query results are served from a QueryCache."""
+
+    def __init__(self, engine, *args, cache: QueryCache, generation=None,
+                 preview_rows: int = PREVIEW_ROWS, guard=None, views: bool = False,
+                 **kwargs):
+        super().__init__(engine, *args, **kwargs)
+        if views:
+            # Not view_support=True: that also asks for materialized views,
+            # which SQLAlchemy's SQLite dialect does not implement
+            self._all_tables |= set(self._inspector.get_view_names(schema=self._schema))
+            self._usable_tables = set(self.get_usable_table_names())
+            self._view_support = True
+        self._cache = cache
+        self._generation = generation
+        self._preview_rows = preview_rows
+        self._guard = guard
+        self._table_info = {}
+        self._frames = OrderedDict()   # normalized SQL → (DataFrame, complete)
+        self._frames_lock = threading.Lock()
+
+    def run(self, command, fetch="all", include_columns=False, **kwargs):
+        if not isinstance(command, str) or fetch != "all" or kwargs.get("parameters"):
+            return super().run(command, fetch, include_columns, **kwargs)
+
+        sql = normalize_sql(command)
+        key = (sql, include_columns, self._generation)
+        result = self._cache.get(key)
+        if result is None:
+            result = self._run_guarded(command, include_columns, sql)
+            self._cache.put(key, result, ttl_for(sql))
+        return result
+
+    def _run_guarded(self, command: str, include_columns: bool, frame_key: str) -> str:
+        if self._guard is None:
+            return self._run_preview(command, include_columns, frame_key)
+        verdict = self._guard.check(command)
+        if verdict.rejected:
+            return verdict.feedback()
+        result = self._run_preview(verdict.sql, include_columns, frame_key)
+        if verdict.problems:   # auto-limited: tell the agent why
+            result += f"\n(Note: {' '.join(verdict.problems)})"
+        return result
+
+    def _run_preview(self, command: str, include_columns: bool, frame_key: str | None = None) -> str:
+        """Like SQLDatabase.run, but fetches at most `preview_rows` + 1 rows."""
+        with self._engine.connect() as conn:
+            cursor = conn.execute(text(command))
+            if not cursor.returns_rows:
+                conn.commit()
+                return ""
+            columns = list(cursor.keys())
+            rows = cursor.fetchmany(self._preview_rows + 1)
+            cursor.close()
+
+        truncated = len(rows) > self._preview_rows
+        if frame_key is not None:
+            frame = pd.DataFrame([tuple(r) for r in rows[: self._preview_rows]], columns=columns)
+            with self._frames_lock:
+                self._frames[frame_key] = (frame, not truncated)
+                self._frames.move_to_end(frame_key)
+                while len(self._frames) > MAX_FRAMES:
+                    self._frames.popitem(last=False)
+        res = [
+            {
+                column: truncate_word(value, length=self._max_string_length)
+                for column, value in row._asdict().items()
+            }
+            for row in rows[: self._preview_rows]
+        ]
+        if not include_columns:
+            res = [tuple(row.values()) for row in res]
+        if not res:
+            return ""
+        if truncated:
+            return (
+                f"{res}\n(Only the first {self._preview_rows} rows are shown. "
+                "The user sees the complete result of this query in a paged "
+                "table, so do not re-query for the remaining rows.)"
+            )
+        return str(res)
+
+    def preview_frame(self, sql: str):
+        """(DataFrame, complete) of the rows `sql_db_query` fetched for `sql`, or None.
+
+        `complete` is False when the result had more than `preview_rows` rows.
+        """
+        with self._frames_lock:
+            return self._frames.get(normalize_sql(extract_raw_sql(sql)))
+
+    def snapshot_table_info(self, cached: dict | None = None) -> dict:
+        """Precompute `get_table_info` (DDL + sample rows) for every usable table.
+
+        The instance is rebuilt for each DB generation.  `cached` is a
+        snapshot taken from an earlier generation with the same schema:
+        its DDL is current and its sample rows are only illustrative, so
+        it is reused as long as it covers every table.
+        """
+        tables = self.get_usable_table_names()
+        if cached and set(tables) <= cached.keys():
+            self._table_info = {table: cached[table] for table in tables}
+        else:
+            self._table_info = {
+                table: super(CachedSQLDatabase, self).get_table_info([table])
+                for table in tables
+            }
+        return self._table_info
+
+    def get_table_info(self, table_names=None, get_col_comments=False):
+        names = self.get_usable_table_names() if table_names is None else table_names
+        if get_col_comments or not set(names) <= self._table_info.keys():
+            return super().get_table_info(table_names, get_col_comments)
+        return "\n\n".join(sorted(self._table_info[t] for t in names))
+
+    def query_frame(self, sql: str, params: dict | None = None) -> pd.DataFrame:
+        """Run `sql` directly (bypassing the LLM and the cache) as a DataFrame."""
+        with self._engine.connect() as conn:
+            return pd.read_sql_query(text(extract_raw_sql(sql)), conn, params=params)
+
+    def pager(self, sql: str, params: dict | None = None) -> ResultPager:
+        """Page-at-a-time view of `sql` for the results table."""
+        return ResultPager(self._engine, extract_raw_sql(sql), params)
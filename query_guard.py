@@ -0,0 +1,163 @@
+"""
+query_guard.py – EXPLAIN QUERY PLAN check in front of the agent's SQL.
+
+Before `sql_db_query` runs a statement, its plan is inspected:
+
+* a joined table that is SCANned for every outer row (no usable join
+  predicate) and plans whose estimated rows visited exceed MAX_COST_ROWS
+  are rejected, with feedback the agent can act on;
+* a full scan of a large table that is sorted without a LIMIT is allowed
+  but run with LIMIT AUTO_LIMIT (a top-N sort instead of a full sort;
+  unsorted results are already only fetched up to the preview size).
+
+Row counts and rows per index key come from `sqlite_stat1` (written by
+ANALYZE in build_indexes.py); table sizes fall back to MAX(rowid).
+"""
+import re
+from dataclasses import dataclass, field
+
+from sqlalchemy import text
+
+LARGE_TABLE_ROWS = 200_000     # a full scan of this many rows is "large"
+CARTESIAN_MIN_ROWS = 1_000     # both sides of an unconstrained join at least this big
+MAX_COST_ROWS = 50_000_000     # estimated rows visited before a plan is rejected
+AUTO_LIMIT = 1_000
+SEARCH_ROWS = 10               # assumed rows per indexed lookup without stats
+UNKNOWN_ROWS = 1_000           # assumed rows of a CTE / subquery scan
+
+_LOOP = re.compile(r"^(SCAN|SEARCH) (\S+)")
+_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\S+)")
+_VTAB_LOOKUP = re.compile(r"VIRTUAL TABLE INDEX \d+:\S")   # constrained, e.g. an R*Tree box
+_FROM = re.compile(
+    r"(?:\bfrom|\bjoin|,)\s+[\"`\[]?(\w+)[\"`\]]?(?:\s+(?:as\s+)?(?!(?:on|using|where|join|inner|left|"
+    r"right|full|cross|natural|group|order|limit|union|except|intersect|from|having|"
+    r"window|and|or|when|then|else|end)\b)(\w+))?",
+    re.I,
+)
+_LIMIT = re.compile(r"\blimit\s+\d+\s*(?:offset\s+\d+\s*)?;?\s*$", re.I)
+
+
+@dataclass
+class Verdict:
+    sql: str                                    # statement to run (possibly limited)
+    rejected: bool = False
+    problems: list = field(default_factory=list)
+    cost: int = 0
+
+    def feedback(self) -> str:
+        return (
+            "Error: query rejected before execution because it would be too expensive "
+            f"(~{self.cost:,} rows visited). " + " ".join(self.problems)
+            + " Rewrite it with join conditions on key columns, filters on indexed "
+            "columns (bus_id, block_id, trip_id, stop_id, dates) or aggregation."
+        )
+
+
+class QueryGuard:
+    """Plans statements with EXPLAIN QUERY PLAN and estimates their cost."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._rows = None
+        self._key_rows = {}   # index name → average rows per leading-column value
+
+    # ------------------------------------------------------------ row counts
+    def table_rows(self) -> dict:
+        if self._rows is None:
+            with self.engine.connect() as conn:
+                rows = {}
+                try:
+                    for tbl, idx, stat in conn.execute(
+                        text("SELECT tbl, idx, stat FROM sqlite_stat1")
+                    ):
+                        counts = [int(n) for n in stat.split() if n.isdigit()]
+                        rows[tbl] = max(rows.get(tbl, 0), counts[0])
+                        if idx and len(counts) > 1:
+                            self._key_rows[idx] = counts[1]
+                except Exception:   # never analyzed
+                    pass
+                tables = conn.execute(text(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                    " AND name NOT LIKE 'sqlite_%'"
+                )).scalars()
+                for table in tables:
+                    if table not in rows:
+                        rows[table] = conn.execute(
+                            text(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table}"')
+                        ).scalar()
+            self._rows = rows
+        return self._rows
+
+    # ------------------------------------------------------------------ check
+    def check(self, sql: str) -> Verdict:
+        verdict = Verdict(sql)
+        try:
+            with self.engine.connect() as conn:
+                plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        except Exception:
+            return verdict   # not plannable (syntax error, …): let it fail normally
+
+        rows = self.table_rows()
+        aliases = {}
+        for table, alias in _FROM.findall(sql):
+            if table in rows:   # skips CTE names and select-list commas
+                aliases[table] = table
+                if alias:
+                    aliases[alias] = table
+
+        groups = {}
+        for node_id, parent, _unused, detail in plan:
+            groups.setdefault(parent, []).append(detail)
+
+        large_scans = []
+        for details in groups.values():
+            loops = []
+            for detail in details:
+                match = _LOOP.match(detail)
+                if not match:
+                    continue
+                kind, name = match.groups()
+                table = aliases.get(name)
+                if kind == "SCAN" and _VTAB_LOOKUP.search(detail):
+                    kind = "SEARCH"
+                if kind == "SEARCH":
+                    index = _INDEX.search(detail)
+                    if "PRIMARY KEY" in detail:
+                        n = 1
+                    elif index and "=?" in detail:
+                        n = self._key_rows.get(index.group(1), SEARCH_ROWS)
+                    else:
+                        n = SEARCH_ROWS
+                else:
+                    n = rows.get(table, UNKNOWN_ROWS)
+                    if n >= LARGE_TABLE_ROWS:
+                        large_scans.append(table)
+                if kind == "SCAN" and loops:
+                    outer = loops[-1]
+                    if n >= CARTESIAN_MIN_ROWS and outer[1] >= CARTESIAN_MIN_ROWS:
+                        verdict.rejected = True
+                        verdict.problems.append(
+                            f"`{table or name}` is scanned in full for every row of "
+                            f"`{outer[0]}`: the join between them has no usable join "
+                            "predicate (cartesian product)."
+                        )
+                loops.append((table or name, n))
+            cost = 1
+            for _name, n in loops:
+                cost *= n
+            verdict.cost += cost if loops else 0
+
+        if verdict.cost > MAX_COST_ROWS and not verdict.rejected:
+            verdict.rejected = True
+            verdict.problems.append("The plan visits too many rows.")
+        if verdict.rejected:
+            return verdict
+
+        sorts = any(d.startswith("USE TEMP B-TREE FOR ORDER BY") for _, _, _, d in plan)
+        if large_scans and sorts and not _LIMIT.search(sql):
+            verdict.problems.append(
+                f"Full scan and sort of large table(s) {', '.join(sorted(set(large_scans)))}; "
+                f"result limited to {AUTO_LIMIT} rows."
+            )
+            verdict.sql = f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT {AUTO_LIMIT}"
+        return verdict
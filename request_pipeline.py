@@ -0,0 +1,83 @@
+"""
+request_pipeline.py – run the domain check and the agent concurrently.
+
+The `is_transit_related` classifier and the LangChain agent are started
+together on an asyncio loop instead of back to back.  If the classifier
+answers "No", the agent is stopped at its next LLM/tool step.  Both run in
+worker threads carrying the Streamlit script context, so the agent's
+StreamlitCallbackHandler keeps rendering into the page.
+"""
+import asyncio
+import threading
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+class AgentCancelled(Exception):
+    """Raised inside the agent run once the domain check has rejected the question."""
+
+
+class CancelOnEvent(BaseCallbackHandler):
+    """Aborts an agent run at the next LLM or tool step after `event` is set."""
+
+    raise_error = True   # let the exception escape instead of being logged
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def _check(self):
+        if self.event.is_set():
+            raise AgentCancelled("question rejected by the domain check")
+
+    def on_llm_start(self, *args, **kwargs):
+        self._check()
+
+    def on_tool_start(self, *args, **kwargs):
+        self._check()
+
+
+def shared_http_client() -> httpx.Client:
+    """One pooled HTTP client for every OpenAI call (cache it per process)."""
+    return httpx.Client(
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
+
+
+def _with_script_ctx(fn):
+    """Wrap `fn` so the worker thread running it can use st.* calls."""
+    ctx = get_script_run_ctx()
+
+    def run(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return run
+
+
+async def _classify_and_run(classify, run_agent):
+    cancel = threading.Event()
+    agent_task = asyncio.create_task(
+        asyncio.to_thread(_with_script_ctx(run_agent), CancelOnEvent(cancel))
+    )
+    allowed = await asyncio.to_thread(_with_script_ctx(classify))
+    if not allowed:
+        cancel.set()
+        try:
+            await agent_task   # returns at the agent's next step boundary
+        except Exception:      # AgentCancelled, or an error we no longer care about
+            pass
+        return False, None
+    return True, await agent_task
+
+
+def answer_with_domain_check(classify, run_agent):
+    """Run `classify()` and `run_agent(cancel_handler)` concurrently.
+
+    `run_agent` must add `cancel_handler` to its callbacks.  Returns
+    (allowed, agent_result); agent_result is None when the question was
+    rejected.
+    """
+    return asyncio.run(_classify_and_run(classify, run_agent))
@@ -0,0 +1,114 @@
+"""
+result_export.py – lazy, streamed CSV / PDF exports of query results.
+
+Nothing is generated until the user clicks a download button (Streamlit
+calls the `data` callable on click).  Rows are streamed from the query
+cursor in chunks straight to a file, PDFs are laid out as a series of
+small ReportLab tables, and finished files are kept on disk keyed by a
+hash of the result, so reruns and repeated clicks reuse them.
+"""
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+EXPORT_DIR = Path(tempfile.gettempdir()) / "vehicles_db_exports"
+MAX_CACHED_EXPORTS = 32
+CHUNK_ROWS = 5_000        # DataFrame rows per chunk
+PDF_TABLE_ROWS = 500      # rows per ReportLab Table (one layout unit)
+LOGO_PATH = Path("logo.png")
+
+MIME_TYPES = {"csv": "text/csv", "pdf": "application/pdf"}
+
+
+def result_hash(*parts) -> str:
+    """Stable hash of whatever identifies a result (SQL, params, DB generation…)."""
+    payload = json.dumps(parts, default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def frame_stream(df, chunk_rows: int = CHUNK_ROWS):
+    """Column names, then row chunks of a DataFrame (same shape as a cursor stream)."""
+    yield list(df.columns)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        yield list(chunk.where(chunk.notna(), None).itertuples(index=False, name=None))
+
+
+def write_csv(path: Path, columns, chunks):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+
+
+def write_pdf(path: Path, columns, chunks):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import landscape, letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Image, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+        ("GRID", (0, 0), (-1, -1), 1, colors.grey),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+    ])
+    pagesize = landscape(letter) if len(columns) > 6 else letter
+
+    story = []
+    if LOGO_PATH.exists():
+        story += [Image(str(LOGO_PATH), width=2.0 * inch, height=1.0 * inch),
+                  Spacer(1, 0.25 * inch)]
+
+    # Many small tables instead of one huge one: ReportLab lays out (and
+    # splits across pages) each table separately, which keeps it linear.
+    block, tables = [], 0
+    for rows in chunks:
+        for row in rows:
+            block.append(["" if v is None else str(v) for v in row])
+            if len(block) == PDF_TABLE_ROWS:
+                story.append(Table([list(columns)] + block, repeatRows=1, style=style))
+                block, tables = [], tables + 1
+    if block or not tables:
+        story.append(Table([list(columns)] + block, repeatRows=1, style=style))
+
+    SimpleDocTemplate(str(path), pagesize=pagesize).build(story)
+
+
+WRITERS = {"csv": write_csv, "pdf": write_pdf}
+
+
+def _prune(keep: int = MAX_CACHED_EXPORTS):
+    files = [p for fmt in WRITERS for p in EXPORT_DIR.glob(f"*.{fmt}")]
+    files = sorted(files, key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[keep:]:
+        old.unlink(missing_ok=True)
+
+
+def export_file(key: str, fmt: str, make_stream) -> Path:
+    """Path of the `fmt` export for result `key`, generated on first use.
+
+    `make_stream()` returns a generator yielding the column names and then
+    chunks of rows; it is only called when the export is not cached yet.
+    """
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = EXPORT_DIR / f"{key}.{fmt}"
+    if path.exists():
+        os.utime(path)   # mark as recently used
+        return path
+
+    fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".part")
+    os.close(fd)
+    stream = make_stream()
+    try:
+        WRITERS[fmt](Path(tmp), next(stream), stream)
+        os.replace(tmp, path)
+    finally:
+        stream.close()   # releases the cursor if the writer stopped early
+        Path(tmp).unlink(missing_ok=True)
+    _prune()
+    return path
@@ -0,0 +1,80 @@
+"""
+result_pager.py – page through a query result without materializing it.
+
+The app keeps only the SQL text of a result in the session; each rerun
+fetches just the visible page with LIMIT/OFFSET, so memory per session is
+bounded by the page size no matter how many rows the query returns.
+"""
+import re
+
+import pandas as pd
+from sqlalchemy import text
+
+PAGE_SIZE = 100
+PAGE_CHUNK_ROWS = 25      # rows added to the table per re-render
+STREAM_CHUNK_ROWS = 5_000
+
+_PAGEABLE = re.compile(r"^\s*(select|with)\b", re.I)
+
+
+def is_pageable(sql: str) -> bool:
+    """Only plain SELECT / WITH queries can be wrapped in a sub-select."""
+    return bool(_PAGEABLE.match(sql))
+
+
+class ResultPager:
+    """Fetches one page of `sql` at a time from a SQLAlchemy engine."""
+
+    def __init__(self, engine, sql: str, params: dict | None = None,
+                 page_size: int = PAGE_SIZE):
+        self.engine = engine
+        self.sql = sql.strip().rstrip(";")
+        self.params = dict(params or {})
+        self.page_size = page_size
+
+    def total_rows(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text(f"SELECT COUNT(*) FROM ({self.sql})"), self.params
+            ).scalar_one()
+
+    def page_count(self, total_rows: int) -> int:
+        return max(1, -(-total_rows // self.page_size))
+
+    def page(self, number: int) -> pd.DataFrame:
+        """Rows of page `number` (1-based) as a DataFrame."""
+        params = {
+            **self.params,
+            "_limit": self.page_size,
+            "_offset": (max(number, 1) - 1) * self.page_size,
+        }
+        with self.engine.connect() as conn:
+            return pd.read_sql_query(
+                text(f"SELECT * FROM ({self.sql}) LIMIT :_limit OFFSET :_offset"),
+                conn,
+                params=params,
+            )
+
+    def page_chunks(self, number: int, chunk_rows: int = PAGE_CHUNK_ROWS):
+        """Page `number` as DataFrame chunks from one cursor, for progressive display."""
+        params = {
+            **self.params,
+            "_limit": self.page_size,
+            "_offset": (max(number, 1) - 1) * self.page_size,
+        }
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                text(f"SELECT * FROM ({self.sql}) LIMIT :_limit OFFSET :_offset"), params
+            )
+            columns = list(result.keys())
+            while rows := result.fetchmany(chunk_rows):
+                yield pd.DataFrame(rows, columns=columns)
+
+    def stream(self, chunk_rows: int = STREAM_CHUNK_ROWS):
+        """Column names, then the full result in chunks from a single cursor."""
+        # No per-statement timeout: the cursor stays open while the file is written
+        with self.engine.connect().execution_options(query_timeout=None) as conn:
+            result = conn.execute(text(self.sql), self.params)
+            yield list(result.keys())
+            while rows := result.fetchmany(chunk_rows):
+                yield rows
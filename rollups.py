@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+rollups.py  ──────────────────────────────────────────────────────────────
+Summary tables over the historical statistics, so "average energy
+efficiency of bus / block / route / driver / day" is a primary-key lookup
+instead of an aggregate over every historical row.
+
+Usage:  python rollups.py [sqlite_db]      (full rebuild)
+
+Each rollup keeps, per group, the record count and the count / sum / mean
+of every measure.  SQLite triggers on the source table apply the delta of
+each inserted, updated (upserted) or deleted row, so the incremental CSV
+load keeps them current at constant cost per new or changed row (the
+upsert skips rows whose values did not change).  A rollup is
+rebuilt in full when its source table was re-created (its triggers went
+with it) or when a lookup table it joins (trips, for routes) changed.
+"""
+import sqlite3
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+BLOCK_STATS = "historical_inservice_block_statistics"
+TRIP_STATS = "historical_inservice_trip_statistics"
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    source: str
+    key: str                    # group column in the rollup table
+    key_sql: str                # expression for the group, over source row "{row}"
+    measures: tuple
+    lookups: tuple = ()         # (table, column) key_sql looks rows up by
+
+
+ROLLUPS = (
+    Rollup("rollup_bus_efficiency", BLOCK_STATS, "bus_id", "{row}.bus_id",
+           ("kwh_per_mile", "energy_used", "soc_used", "avg_speed")),
+    Rollup("rollup_block_efficiency", BLOCK_STATS, "block_id", "{row}.block_id",
+           ("kwh_per_mile", "energy_used", "soc_used", "avg_speed")),
+    Rollup("rollup_day_efficiency", BLOCK_STATS, "record_date", "{row}.record_date",
+           ("kwh_per_mile", "energy_used", "soc_used", "avg_speed")),
+    Rollup("rollup_driver_efficiency", TRIP_STATS, "driver_id", "{row}.driver_id",
+           ("kwh_per_mile",)),
+    Rollup("rollup_route_efficiency", TRIP_STATS, "route_id",
+           "(SELECT route_id FROM trips WHERE trips.trip_id = {row}.trip_id)",
+           ("kwh_per_mile",), lookups=(("trips", "trip_id"),)),
+)
+
+
+def _avg_column(measure: str) -> str:
+    return measure if measure.startswith("avg_") else f"avg_{measure}"
+
+
+def _columns(conn, table: str) -> dict[str, str]:
+    """Column name → declared type."""
+    return {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _key_type(conn, rollup: Rollup) -> str:
+    """Declared type of the group column, so bound text parameters still match."""
+    for table in (rollup.source, *(t for t, _ in rollup.lookups)):
+        key_type = _columns(conn, table).get(rollup.key)
+        if key_type is not None:
+            return key_type
+    return ""
+
+
+def _delta_sql(rollup: Rollup, measures, row: str, sign: int) -> str:
+    """Upsert adding (sign=1) or removing (sign=-1) one source row's contribution."""
+    key = rollup.key_sql.format(row=row)
+    cols = ["records"]
+    values = [str(sign)]
+    updates = ["records = records + excluded.records"]
+    for m in measures:
+        cols += [f"{m}_n", f"{m}_sum", _avg_column(m)]
+        values += [f"{sign} * ({row}.{m} IS NOT NULL)", f"{sign} * COALESCE({row}.{m}, 0)",
+                   f"{row}.{m}"]
+        updates += [
+            f"{m}_n = {m}_n + excluded.{m}_n",
+            f"{m}_sum = {m}_sum + excluded.{m}_sum",
+            f"{_avg_column(m)} = ({m}_sum + excluded.{m}_sum)"
+            f" / NULLIF({m}_n + excluded.{m}_n, 0)",
+        ]
+    sql = (
+        f'INSERT INTO "{rollup.name}" ("{rollup.key}", {", ".join(cols)}) '
+        f"SELECT {key}, {', '.join(values)} WHERE {key} IS NOT NULL "
+        f'ON CONFLICT ("{rollup.key}") DO UPDATE SET {", ".join(updates)};'
+    )
+    if sign < 0:
+        sql += f' DELETE FROM "{rollup.name}" WHERE "{rollup.key}" = {key} AND records <= 0;'
+    return sql
+
+
+def _create_triggers(conn, rollup: Rollup, measures):
+    prefix = f"trg_{rollup.name}"
+    for event, body in (
+        ("INSERT", _delta_sql(rollup, measures, "NEW", 1)),
+        ("DELETE", _delta_sql(rollup, measures, "OLD", -1)),
+        ("UPDATE", _delta_sql(rollup, measures, "OLD", -1) + " "
+                   + _delta_sql(rollup, measures, "NEW", 1)),
+    ):
+        conn.execute(f'DROP TRIGGER IF EXISTS "{prefix}__{event.lower()}"')
+        conn.execute(
+            f'CREATE TRIGGER "{prefix}__{event.lower()}" AFTER {event} ON "{rollup.source}" '
+            f"BEGIN {body} END"
+        )
+
+
+def _rebuild(conn, rollup: Rollup, measures):
+    key_type = _key_type(conn, rollup)
+    measure_cols = ", ".join(
+        f'"{m}_n" INTEGER, "{m}_sum" REAL, "{_avg_column(m)}" REAL' for m in measures
+    )
+    conn.execute(f'DROP TABLE IF EXISTS "{rollup.name}"')
+    conn.execute(
+        f'CREATE TABLE "{rollup.name}" ("{rollup.key}" {key_type} PRIMARY KEY, records INTEGER'
+        + (f", {measure_cols}" if measures else "") + ")"
+    )
+    key = rollup.key_sql.format(row="s")
+    aggregates = "".join(f', COUNT(s."{m}"), TOTAL(s."{m}"), AVG(s."{m}")' for m in measures)
+    conn.execute(
+        f'INSERT INTO "{rollup.name}" SELECT {key}, COUNT(*){aggregates} '
+        f'FROM "{rollup.source}" AS s WHERE {key} IS NOT NULL GROUP BY 1'
+    )
+
+
+def refresh_rollups(conn: sqlite3.Connection, changed=()) -> list[str]:
+    """Create or rebuild the rollups that need it; return the rebuilt names.
+
+    `changed` lists tables written since the last call.  Rollups whose
+    triggers still exist are already current unless one of their lookup
+    tables is in `changed`.  Run inside the loader's transaction so the
+    app never sees base tables and rollups out of step.
+    """
+    tables = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    }
+    triggers = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'")
+    }
+    rebuilt = []
+    for rollup in ROLLUPS:
+        lookup_tables = {table for table, _ in rollup.lookups}
+        if rollup.source not in tables or not lookup_tables <= tables:
+            continue
+        columns = _columns(conn, rollup.source)
+        if rollup.key_sql == f"{{row}}.{rollup.key}" and rollup.key not in columns:
+            continue
+        measures = tuple(m for m in rollup.measures if m in columns)
+        if (
+            rollup.name in tables
+            and f"trg_{rollup.name}__insert" in triggers
+            and not lookup_tables & set(changed)
+        ):
+            continue
+        # The loader re-created the lookup table, so build_indexes hasn't run yet;
+        # without this index every source row would scan it (same name as build_indexes)
+        for table, column in rollup.lookups:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_{table}__{column}" ON "{table}" ("{column}")'
+            )
+        _rebuild(conn, rollup, measures)
+        _create_triggers(conn, rollup, measures)
+        rebuilt.append(rollup.name)
+    if rebuilt:
+        print(f"📈 Rebuilt {len(rebuilt)} rollup table(s): {', '.join(rebuilt)}")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    db_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("vehicles.db")
+    if not db_file.exists():
+        sys.exit(f"Database file not found at: {db_file}")
+    with sqlite3.connect(db_file) as connection:
+        for name in (r.name for r in ROLLUPS):
+            connection.execute(f'DROP TABLE IF EXISTS "{name}"')
+        refresh_rollups(connection)
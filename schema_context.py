@@ -0,0 +1,197 @@
+"""
+schema_context.py – per-question pruning of the modular system prompt.
+
+The full system prompt is all of `modular_prompt/` (~19 KB), sent on
+every agent step.  `PromptPruner` picks the tables a question is about,
+using the narrowing hints in `table_selection_heuristics.md`, direct table
+mentions and GTFS vocabulary, then keeps only the prompt lines that are
+either general guidance or about those tables, plus their slice of
+`structured_memory.json`.  If no table can be picked, the full prompt is
+used unchanged.
+"""
+import json
+import re
+from pathlib import Path
+
+GTFS_SECTION = "GTFS Static Tables"
+
+# GTFS vocabulary → tables the agent needs for it
+GTFS_TERMS = {
+    "route": ["routes", "trips"],
+    "trip": ["trips", "stop_times"],
+    "stop": ["stops", "stop_times"],
+    "schedule": ["trips", "stop_times", "calendar", "calendar_dates"],
+    "timetable": ["trips", "stop_times"],
+    "calendar": ["calendar", "calendar_dates"],
+    "service": ["calendar", "calendar_dates", "trips"],
+    "holiday": ["calendar_dates"],
+    "weekday": ["calendar"],
+    "shape": ["shapes", "trips"],
+    "geometry": ["shapes", "trips"],
+    "fare": ["fare_attributes", "fare_rules"],
+    "transfer": ["transfers"],
+    "frequenc": ["frequencies"],
+    "headway": ["frequencies"],
+    "agency": ["agency"],
+    "feed": ["feed_info"],
+}
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "bus", "buses", "data",
+    "info", "use", "are", "is", "of", "if", "to", "a", "an", "or", "on",
+    "real", "time", "current", "last", "one", "minute", "start", "end",
+}
+
+
+def _words(text: str) -> set[str]:
+    return {w for w in re.findall(r"[a-z0-9_]+", text.lower()) if w not in _STOPWORDS}
+
+
+class PromptPruner:
+    """Builds a trimmed system prompt containing only the relevant tables."""
+
+    def __init__(self, folder: Path, clean=lambda text: text):
+        folder = Path(folder)
+        self._set_memory(json.loads((folder / "structured_memory.json").read_text()))
+        self.hints = self._parse_hints(
+            (folder / "table_selection_heuristics.md").read_text()
+        )
+        # Every prompt file, in alphabetical order: the full system prompt
+        self._set_files([
+            (path.name, clean(path.read_text().strip()))
+            for path in sorted(folder.glob("*.*"))
+        ])
+
+    def _set_memory(self, memory: dict):
+        self.memory = memory
+        self.gtfs_tables = list(memory.get(GTFS_SECTION, {}).get("joins", {}))
+        self.tables = [t for t in memory if t != GTFS_SECTION] + self.gtfs_tables
+
+    def _set_files(self, files):
+        self.files = [tuple(f) for f in files]
+        self.full_prompt = "\n\n".join(text for _, text in self.files)
+
+    # -------------------------------------------------------------- persistence
+    def state(self) -> dict:
+        """JSON-serialisable parsed state (see prompt_bundle.py)."""
+        return {
+            "memory": self.memory,
+            "hints": [[sorted(p), sorted(w), sorted(t)] for p, w, t in self.hints],
+            "files": self.files,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "PromptPruner":
+        """Rebuild a pruner from `state()` without reading or parsing the prompt files."""
+        pruner = cls.__new__(cls)
+        pruner._set_memory(state["memory"])
+        pruner.hints = [(set(p), set(w), set(t)) for p, w, t in state["hints"]]
+        pruner._set_files(state["files"])
+        return pruner
+
+    # ---------------------------------------------------------------- selection
+    def _mentions(self, line: str) -> set[str]:
+        """Tables referenced in a prompt line (`name`, name.csv or a long bare name)."""
+        found = set()
+        for table in self.tables:
+            if (
+                f"`{table}`" in line
+                or f"{table}.csv" in line
+                or ("_" in table and re.search(rf"\b{table}\b", line))
+            ):
+                found.add(table)
+        return found
+
+    def _parse_hints(self, text: str) -> list[tuple[set[str], set[str], set[str]]]:
+        """Heuristic lines "left → `table`" as (phrases, words, tables)."""
+        hints = []
+        for line in text.splitlines():
+            if "→" not in line:
+                continue
+            left, right = line.split("→", 1)
+            # Generic "→ GTFS Static Tables" hints are covered by GTFS_TERMS
+            tables = self._mentions(right)
+            if tables:
+                phrases = {p.lower() for p in re.findall(r"[\"“](.+?)[\"”]", left)}
+                hints.append((phrases, _words(left), tables))
+        return hints
+
+    def select_tables(self, question: str) -> set[str]:
+        q = question.lower()
+        q_words = _words(q)
+        selected = {t for t in self.tables if t in q or t.replace("_", " ") in q}
+
+        for phrases, words, tables in self.hints:
+            if any(p in q for p in phrases) or len(words & q_words) >= 2:
+                selected |= tables
+
+        for term, tables in GTFS_TERMS.items():
+            if re.search(rf"\b{term}", q):
+                selected.update(t for t in tables if t in self.tables)
+        return selected
+
+    # ------------------------------------------------------------------ pruning
+    @staticmethod
+    def _blocks(text: str) -> list[list[str]]:
+        """Split into blocks: headings, bullets and table rows start a new one;
+        indented, numbered or plain continuation lines stay with their block."""
+        blocks = []
+        for line in text.splitlines():
+            starts_block = (
+                not blocks
+                or not line.strip()
+                or not blocks[-1][-1].strip()
+                or line.startswith(("#", "- ", "* ", "|", "**"))
+                or blocks[-1][-1].startswith("#")
+            )
+            if starts_block:
+                blocks.append([line])
+            else:
+                blocks[-1].append(line)
+        return blocks
+
+    def _prune_text(self, text: str, selected: set[str]) -> str:
+        kept = [
+            line
+            for block in self._blocks(text)
+            if not (mentioned := self._mentions("\n".join(block))) or mentioned & selected
+            for line in block
+        ]
+        # Drop headings whose whole section was pruned away
+        out = []
+        for i, line in enumerate(kept):
+            if line.startswith("#"):
+                rest = next((l for l in kept[i + 1:] if l.strip()), "#")
+                if rest.startswith("#") and rest.count("#") <= line.count("#"):
+                    continue
+            out.append(line)
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(out)).strip()
+
+    def build(self, question: str) -> tuple[str, set[str]]:
+        """Return (system prompt, selected tables) for `question`."""
+        selected = self.select_tables(question)
+        if not selected:
+            return self.full_prompt, selected
+
+        memory = {t: spec for t, spec in self.memory.items() if t in selected}
+        gtfs = self.memory.get(GTFS_SECTION, {}).get("joins", {})
+        if selected & set(gtfs):
+            memory[GTFS_SECTION] = {
+                "joins": {t: cols for t, cols in gtfs.items() if t in selected}
+            }
+
+        parts = [
+            json.dumps(memory, ensure_ascii=True, indent=1)
+            if name == "structured_memory.json"
+            else self._prune_text(text, selected)
+            for name, text in self.files
+        ]
+        return "\n\n".join(p for p in parts if p), selected
+
+
+def count_tokens(llm, text: str) -> int:
+    """Token count via the model's tokenizer, or a ~4 chars/token estimate."""
+    try:
+        return llm.get_num_tokens(text)
+    except Exception:  # tokenizer unavailable (e.g. offline tiktoken download)
+        return len(text) // 4
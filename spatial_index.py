@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+spatial_index.py  ────────────────────────────────────────────────────────
+R*Tree indexes over stop, shape-point and latest vehicle coordinates, so
+"nearest bus / stop" and bounding-box questions don't scan every row.
+
+Usage:  python spatial_index.py [sqlite_db]      (full rebuild)
+
+What the agent sees (filter the views on lat / lon to use the R*Tree):
+
+    stops_geo              stop_id, stop_name, lat, lon
+    shapes_geo             shape_id, shape_pt_sequence, lat, lon
+    vehicle_positions_geo  bus_id, tmstmp, block_id, source, lat, lon
+    spatial_ref            lon_scale, miles_per_degree  (one row, for distances)
+
+`vehicle_positions` holds the latest fix per bus.  Like the rollups, it is
+kept current by triggers on the realtime tables, so the minutely
+incremental load updates positions (and their R*Tree entries) row by row;
+the static GTFS indexes are rebuilt when stops / shapes are reloaded.
+R*Tree coordinates are 32-bit floats (~0.5 m), plenty for dispatch.
+"""
+import math
+import sqlite3
+import sys
+from pathlib import Path
+
+MILES_PER_DEGREE = 69.05           # one degree of latitude
+POSITION_SOURCES = (               # realtime tables with bus_id, tmstmp, lat, lon
+    "realtime_inservice_dispatch_data",
+    "realtime_cad_avl_data",
+)
+
+# base table → (lat column, lon column, columns shown in its _geo view)
+STATIC_INDEXES = {
+    "stops": ("stop_lat", "stop_lon", "b.stop_id, b.stop_name"),
+    "shapes": ("shape_pt_lat", "shape_pt_lon", "b.shape_id, b.shape_pt_sequence"),
+}
+
+
+def _columns(conn, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _objects(conn, kind: str) -> set[str]:
+    return {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))
+    }
+
+
+def _build_static(conn, table: str):
+    lat, lon, view_columns = STATIC_INDEXES[table]
+    rtree = f"{table}_rtree"
+    conn.execute(f'DROP TABLE IF EXISTS "{rtree}"')
+    conn.execute(f'CREATE VIRTUAL TABLE "{rtree}" USING rtree(id, min_lat, max_lat, min_lon, max_lon)')
+    conn.execute(
+        f'INSERT INTO "{rtree}" SELECT rowid, "{lat}", "{lat}", "{lon}", "{lon}" FROM "{table}" '
+        f'WHERE "{lat}" IS NOT NULL AND "{lon}" IS NOT NULL'
+    )
+    conn.execute(f'DROP VIEW IF EXISTS "{table}_geo"')
+    conn.execute(
+        f'CREATE VIEW "{table}_geo" AS SELECT {view_columns}, r.min_lat AS lat, r.min_lon AS lon '
+        f'FROM "{rtree}" AS r JOIN "{table}" AS b ON b.rowid = r.id'
+    )
+
+
+def _build_spatial_ref(conn):
+    """Longitude scale at the network's mean latitude (degrees → comparable units)."""
+    mean_lat = conn.execute("SELECT AVG(stop_lat) FROM stops").fetchone()[0] or 0.0
+    conn.execute("DROP TABLE IF EXISTS spatial_ref")
+    conn.execute("CREATE TABLE spatial_ref (lon_scale REAL, miles_per_degree REAL)")
+    conn.execute(
+        "INSERT INTO spatial_ref VALUES (?, ?)",
+        (math.cos(math.radians(mean_lat)), MILES_PER_DEGREE),
+    )
+
+
+def _position_upsert(source: str, has_block: bool, row: str, from_sql: str = "") -> str:
+    """Move each bus to `row`'s fix if it is at least as new as the stored one."""
+    block = f"{row}.block_id" if has_block else "NULL"
+    return (
+        "INSERT INTO vehicle_positions (bus_id, tmstmp, block_id, source, lat, lon) "
+        f"SELECT {row}.bus_id, {row}.tmstmp, {block}, '{source}', {row}.lat, {row}.lon "
+        f"{from_sql} WHERE {row}.bus_id IS NOT NULL "
+        f"AND {row}.lat IS NOT NULL AND {row}.lon IS NOT NULL "
+        "ON CONFLICT (bus_id) DO UPDATE SET tmstmp = excluded.tmstmp, "
+        "block_id = excluded.block_id, source = excluded.source, "
+        "lat = excluded.lat, lon = excluded.lon "
+        "WHERE excluded.tmstmp >= COALESCE(vehicle_positions.tmstmp, '')"
+    )
+
+
+def _declared_type(conn, table: str, column: str) -> str:
+    return next(
+        (row[2] for row in conn.execute(f'PRAGMA table_info("{table}")') if row[1] == column), ""
+    )
+
+
+def _build_positions(conn, sources):
+    # Same declared types as the source, so bound text parameters still match
+    bus_type = _declared_type(conn, sources[0], "bus_id")
+    block_type = _declared_type(conn, sources[0], "block_id")
+    conn.execute("DROP TABLE IF EXISTS vehicle_positions_rtree")
+    conn.execute("DROP TABLE IF EXISTS vehicle_positions")
+    conn.execute(
+        f"CREATE TABLE vehicle_positions (id INTEGER PRIMARY KEY, bus_id {bus_type} UNIQUE NOT NULL,"
+        f" tmstmp TEXT, block_id {block_type}, source TEXT, lat REAL, lon REAL)"
+    )
+    conn.execute(
+        "CREATE VIRTUAL TABLE vehicle_positions_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+    )
+    # vehicle_positions → R*Tree (a virtual table: no upserts, so one trigger per event)
+    conn.execute("DROP TRIGGER IF EXISTS trg_vehicle_positions__insert")
+    conn.execute(
+        "CREATE TRIGGER trg_vehicle_positions__insert AFTER INSERT ON vehicle_positions "
+        "BEGIN INSERT INTO vehicle_positions_rtree "
+        "VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon); END"
+    )
+    conn.execute("DROP TRIGGER IF EXISTS trg_vehicle_positions__update")
+    conn.execute(
+        "CREATE TRIGGER trg_vehicle_positions__update AFTER UPDATE OF lat, lon ON vehicle_positions "
+        "BEGIN UPDATE vehicle_positions_rtree SET min_lat = NEW.lat, max_lat = NEW.lat, "
+        "min_lon = NEW.lon, max_lon = NEW.lon WHERE id = NEW.id; END"
+    )
+
+    for source in sources:
+        has_block = "block_id" in _columns(conn, source)
+        conn.execute(_position_upsert(source, has_block, "s", f'FROM "{source}" AS s'))
+        for event in ("INSERT", "UPDATE"):
+            conn.execute(f'DROP TRIGGER IF EXISTS "trg_{source}__positions_{event.lower()}"')
+            conn.execute(
+                f'CREATE TRIGGER "trg_{source}__positions_{event.lower()}" '
+                f'AFTER {event} ON "{source}" BEGIN '
+                f"{_position_upsert(source, has_block, 'NEW')}; END"
+            )
+
+    conn.execute("DROP VIEW IF EXISTS vehicle_positions_geo")
+    conn.execute(
+        "CREATE VIEW vehicle_positions_geo AS SELECT v.bus_id, v.tmstmp, v.block_id, v.source,"
+        " r.min_lat AS lat, r.min_lon AS lon"
+        " FROM vehicle_positions_rtree AS r JOIN vehicle_positions AS v ON v.id = r.id"
+    )
+
+
+def refresh_spatial(conn: sqlite3.Connection, changed=()) -> list[str]:
+    """Create or rebuild the spatial indexes that need it; return their names.
+
+    Static indexes are rebuilt when their base table is in `changed` (or
+    missing); vehicle positions only when a source table lost its triggers
+    (it was re-created), since the triggers keep them current otherwise.
+    """
+    tables = _objects(conn, "table")
+    triggers = _objects(conn, "trigger")
+    changed = set(changed)
+    rebuilt = []
+
+    for table in STATIC_INDEXES:
+        lat, lon, _ = STATIC_INDEXES[table]
+        if table not in tables or not {lat, lon} <= _columns(conn, table):
+            continue
+        if table in changed or f"{table}_rtree" not in tables:
+            _build_static(conn, table)
+            rebuilt.append(f"{table}_rtree")
+    if "stops_rtree" in rebuilt or ("stops" in tables and "spatial_ref" not in tables):
+        _build_spatial_ref(conn)
+
+    sources = [
+        s for s in POSITION_SOURCES
+        if s in tables and {"bus_id", "tmstmp", "lat", "lon"} <= _columns(conn, s)
+    ]
+    if sources and (
+        "vehicle_positions" not in tables
+        or any(f"trg_{s}__positions_insert" not in triggers for s in sources)
+    ):
+        _build_positions(conn, sources)
+        rebuilt.append("vehicle_positions_rtree")
+
+    if rebuilt:
+        print(f"🗺️  Rebuilt {len(rebuilt)} spatial index(es): {', '.join(rebuilt)}")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    db_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("vehicles.db")
+    if not db_file.exists():
+        sys.exit(f"Database file not found at: {db_file}")
+    with sqlite3.connect(db_file) as connection:
+        refresh_spatial(connection, changed=STATIC_INDEXES)
+        connection.execute("DROP TABLE IF EXISTS vehicle_positions")
+        refresh_spatial(connection)
@@ -1,21 +1,48 @@
+"""
+Load the dispatch/GTFS CSV exports into vehicles.db, one table per CSV.
+
+Usage:  python sqlite.py [--incremental] [--no-cache]
+
+Default: rebuild every table from its CSV.
+--incremental: skip CSVs whose content hash matches the last load, upsert
+the realtime and historical tables by their declared keys (INSERT ... ON
+CONFLICT) and replace only the static tables that changed.  The rollup
+tables over the historical statistics (rollups.py) and the latest
+vehicle positions (spatial_index.py) follow along.
+
+A CSV whose exact content was parsed before is read back from the typed
+Arrow copy in the columnar cache (columnar_cache.py) instead of being
+re-parsed; --no-cache turns this off.
+
+Either way the database is updated in place inside one WAL transaction:
+the Streamlit app keeps reading the previous generation until COMMIT, so
+it never sees a missing or half-built vehicles.db.
+"""
+import argparse
 import sqlite3
+import time
 from pathlib import Path
 import pandas as pd
 
+import columnar_cache
+from build_indexes import build_indexes
+from columnar_cache import CACHE_DIR, file_hash
+from convert_to_sql import ingest_pragmas
+from gtfs_schedule import refresh_schedule
+from rollups import refresh_rollups
+from spatial_index import refresh_spatial
+
 # === File Paths ===
 db_path = Path("vehicles.db")
 
-# === Remove existing DB if it exists ===
-if db_path.exists():
-    print("🗑️ Deleting existing vehicles.db")
-    db_path.unlink()
-
 # === CSV file to table mapping ===
 csv_files = {
     "bus_specifications": "bus_specifications.csv",
     "realtime_inservice_dispatch_data": "realtime_inservice_dispatch_data.csv",
     "realtime_inservice_bus_soc_forecast": "realtime_inservice_bus_soc_forecast.csv",
     "candidates_bus_block_end_soc": "candidates_bus_block_end_soc.csv",
+    "historical_inservice_block_statistics": "historical_inservice_block_statistics.csv",
+    "historical_inservice_trip_statistics": "historical_inservice_trip_statistics.csv",
     "routes": "routes.csv",
     "trips": "trips.csv",
     "stop_times": "stop_times.csv",
@@ -31,30 +58,219 @@ csv_files = {
     "transfers":"transfers.csv",
 }
 
-# === Create a new SQLite connection ===
-connection = sqlite3.connect(db_path)
+# === Realtime / historical tables are upserted by these keys in --incremental mode ===
+upsert_keys = {
+    "realtime_inservice_dispatch_data": ["bus_id", "tmstmp"],
+    "realtime_inservice_bus_soc_forecast": ["bus_id", "timestamp"],
+    "historical_inservice_block_statistics": ["bus_id", "block_id", "record_date"],
+    "historical_inservice_trip_statistics": ["bus_id", "trip_id", "record_date"],
+}
+
+# === Bookkeeping table: content hash of the CSV behind each table ===
+STATE_TABLE = "_ingest_state"
+
+
+def read_csv(file_path: Path) -> pd.DataFrame:
+    df = pd.read_csv(file_path, dtype=str, na_values="", keep_default_na=False)
+
+    # Try converting to numeric types when safe
+    for col in df.columns:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except ValueError:
+            pass
+    return df
+
+
+def read_csv_cached(file_path: Path, digest: str,
+                    cache_dir: Path | None = CACHE_DIR) -> pd.DataFrame:
+    """read_csv, served from the columnar cache when this exact file was seen before."""
+    df = columnar_cache.read_frame(digest, cache_dir) if cache_dir else None
+    if df is None:
+        df = read_csv(file_path)
+        if cache_dir:
+            columnar_cache.write_frame(digest, df, cache_dir)
+    return df
+
+
+def sql_type(series: pd.Series) -> str:
+    """Map a column to INTEGER / REAL / TEXT (integral floats → INTEGER)."""
+    if series.dtype.kind in ("i", "u", "b"):
+        return "INTEGER"
+    if series.dtype.kind == "f":
+        values = series.dropna()
+        return "INTEGER" if (values == values.round()).all() else "REAL"
+    return "TEXT"
+
+
+def rows_of(df: pd.DataFrame):
+    """DataFrame rows as plain tuples with NaN → None, ready for executemany."""
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
 
-try:
-    for table_name, file_name in csv_files.items():
+def replace_table(cur, table_name: str, df: pd.DataFrame):
+    columns_sql = ", ".join(f'"{c}" {sql_type(df[c])}' for c in df.columns)
+    cur.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    cur.execute(f'CREATE TABLE "{table_name}" ({columns_sql})')
+    cur.executemany(
+        f'INSERT INTO "{table_name}" VALUES ({", ".join("?" * len(df.columns))})',
+        rows_of(df),
+    )
+
+
+def upsert_table(cur, table_name: str, df: pd.DataFrame, keys: list[str],
+                 drop_null_keys: bool = True):
+    """INSERT ... ON CONFLICT(keys) DO UPDATE, creating table/columns as needed.
+
+    Rows with a blank key never conflict, so an upsert would add them again
+    on every run; with `drop_null_keys` (incremental loads) they are skipped.
+    Rows repeating a key collapse into one (the last wins).  Both are counted.
+    """
+    key_list = ", ".join(keys)
+    blank = df[keys].isna().any(axis=1)
+    if drop_null_keys and blank.any():
+        print(f"  ⚠️  {blank.sum():,} rows without {key_list} skipped")
+        df, blank = df[~blank], blank[~blank]
+    repeated = df.duplicated(subset=keys, keep="last") & ~blank
+    if repeated.any():
+        print(f"  ⚠️  {repeated.sum():,} rows repeat an earlier ({key_list}); the last one is kept")
+    columns_sql = ", ".join(f'"{c}" {sql_type(df[c])}' for c in df.columns)
+    cur.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns_sql})')
+
+    # New CSV columns are added rather than forcing a rebuild
+    existing = {row[1] for row in cur.execute(f'PRAGMA table_info("{table_name}")')}
+    for col in df.columns:
+        if col not in existing:
+            cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" {sql_type(df[col])}')
+
+    cols_sql = ", ".join(f'"{c}"' for c in df.columns)
+    key_sql = ", ".join(f'"{k}"' for k in keys)
+    cur.execute(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS "uq_{table_name}__{"_".join(keys)}" '
+        f'ON "{table_name}" ({key_sql})'
+    )
+    values = [c for c in df.columns if c not in keys]
+    updates = ", ".join(f'"{c}" = excluded."{c}"' for c in values)
+    # Unchanged rows are left alone, so they don't fire the rollup triggers
+    changed = " OR ".join(f'"{table_name}"."{c}" IS NOT excluded."{c}"' for c in values)
+    cur.executemany(
+        f'INSERT INTO "{table_name}" ({cols_sql}) '
+        f'VALUES ({", ".join("?" * len(df.columns))}) '
+        f'ON CONFLICT ({key_sql}) DO '
+        + (f"UPDATE SET {updates} WHERE {changed}" if updates else "NOTHING"),
+        rows_of(df),
+    )
+
+
+def drop_all_tables(cur):
+    """Empty the database (the old delete-the-file rebuild, minus the gap)."""
+    objects = cur.execute(
+        "SELECT type, name FROM sqlite_master "
+        "WHERE type IN ('view', 'table') AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY type = 'table'"   # views (e.g. blocks_by_day) first
+    ).fetchall()
+    for kind, name in objects:
+        # IF EXISTS: dropping an R*Tree also drops its shadow tables
+        cur.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+
+
+def load_tables(connection: sqlite3.Connection, incremental: bool = False,
+                files: dict | None = None, cache_dir: Path | None = CACHE_DIR) -> int:
+    """Load every CSV in `files` (default `csv_files`); return how many tables were written."""
+    cur = connection.cursor()
+    if not incremental:
+        print("🗑️ Dropping existing tables")
+        drop_all_tables(cur)
+    cur.execute(
+        f'CREATE TABLE IF NOT EXISTS "{STATE_TABLE}" '
+        "(table_name TEXT PRIMARY KEY, file_hash TEXT, loaded_at REAL)"
+    )
+    last_hash = dict(cur.execute(f'SELECT table_name, file_hash FROM "{STATE_TABLE}"'))
+    written = []
+
+    for table_name, file_name in (files or csv_files).items():
         file_path = Path(file_name)
 
         if not file_path.exists():
             print(f"⚠️  Skipping missing file: {file_name}")
             continue
 
-        print(f"📦 Importing {file_name} → `{table_name}`")
-        df = pd.read_csv(file_path, dtype=str, na_values="", keep_default_na=False)
+        digest = file_hash(file_path)
+        if incremental and last_hash.get(table_name) == digest:
+            print(f"⏭️  Unchanged since last load: {file_name}")
+            continue
+
+        df = read_csv_cached(file_path, digest, cache_dir)
+        keys = upsert_keys.get(table_name, [])
+        if keys and set(keys) <= set(df.columns):
+            # Keyed tables always carry their unique index, so a full load
+            # followed by --incremental runs upserts against the same schema
+            if not incremental:
+                cur.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            print(f"🔁 Upserting {file_name} → `{table_name}` on {', '.join(keys)}")
+            # A full load keeps blank-key rows (they can't collide in a fresh table)
+            upsert_table(cur, table_name, df, keys, drop_null_keys=incremental)
+        else:
+            print(f"📦 Importing {file_name} → `{table_name}`")
+            replace_table(cur, table_name, df)
+
+        cur.execute(
+            f'INSERT OR REPLACE INTO "{STATE_TABLE}" VALUES (?, ?, ?)',
+            (table_name, digest, time.time()),
+        )
+        written.append(table_name)
+
+    # Upserted rows already reached the rollups through their triggers;
+    # re-created sources (and changed trips, for routes) are rebuilt here
+    refresh_rollups(connection, changed=written)
+    refresh_spatial(connection, changed=written)
+    # Also extends service_days as the date moves toward the end of its horizon
+    refresh_schedule(connection, changed=written)
+    return len(written)
+
+
+def load_csvs(database: Path = db_path, incremental: bool = False,
+              files: dict | None = None, cache_dir: Path | None = CACHE_DIR) -> int:
+    """Load the CSVs into `database` in one WAL transaction, then index it."""
+    # === Create a new SQLite connection ===
+    # Autocommit mode: the whole load is one explicit transaction, so readers
+    # keep seeing the previous data until COMMIT.
+    connection = sqlite3.connect(database, isolation_level=None)
+
+    try:
+        with ingest_pragmas(connection):
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                changed = load_tables(connection, incremental=incremental, files=files,
+                                      cache_dir=cache_dir)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        print("✅ All tables loaded successfully.")
 
-        # Try converting to numeric types when safe
-        for col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="ignore", downcast="float")
+        # Post-ingest stage: join-key indexes + planner statistics
+        # (a full ANALYZE is too slow to run on every minutely refresh)
+        if changed:
+            build_indexes(connection, analyze=not incremental)
+    finally:
+        connection.close()
+        print("🧠 Database connection closed.")
+    return changed
 
-        df.to_sql(table_name, connection, if_exists="replace", index=False)
 
-    connection.commit()
-    print("✅ All tables loaded successfully.")
-finally:
-    connection.close()
-    print("🧠 Database connection closed.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the CSV exports into vehicles.db.")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="upsert realtime tables and skip unchanged CSVs instead of rebuilding",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="always parse the CSVs; don't read or write the columnar cache",
+    )
+    args = parser.parse_args()
 
-print("📁 vehicles.db is ready to use.")
+    load_csvs(db_path, incremental=args.incremental,
+              cache_dir=None if args.no_cache else CACHE_DIR)
+    print("📁 vehicles.db is ready to use.")
@@ -2,84 +2,51 @@
 # app.py – streamlined, hardened version for vehicles.db                      #
 # (ChatGPT API + developer‑defined system instructions)                       #
 ###############################################################################
-import unicodedata
-from pathlib import Path
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-import streamlit as st
-from sqlalchemy import create_engine
+import os
 import sqlite3
+import time
+import unicodedata
+import uuid
+from contextlib import closing
 from io import StringIO
-from io import BytesIO
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-import pandas as pd
-from langchain.agents import create_sql_agent, AgentExecutor
-from langchain.agents.agent_toolkits import SQLDatabaseToolkit
-from langchain.agents.agent_types import AgentType
-from langchain.callbacks import StreamlitCallbackHandler
-from langchain.sql_database import SQLDatabase
-from langchain_openai import ChatOpenAI
-from langchain_community.agent_toolkits.sql.base import create_sql_agent
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_community.utilities import SQLDatabase
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
-from langchain_community.agent_toolkits.sql.prompt import SQL_PREFIX as _LC_SQL_PREFIX
-
-import re
-# Attempt to pull LangChain's default SQL prompt so we can append our own.
-try:
-    from langchain.agents.agent_toolkits.sql.prompt import SQL_PREFIX as _LC_SQL_PREFIX
-except Exception:  # Fallback if import path changes
-    _LC_SQL_PREFIX = ""
-
-
 from pathlib import Path
 
+_SCRIPT_STARTED = time.perf_counter()
 
-import json
-
-HISTORY_FILE = Path("chat_history.json")
+import pandas as pd
+import streamlit as st
 
-def save_history():
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(st.session_state["messages"], f)
+# Only light modules here: the LangChain agent stack, the OpenAI chat model
+# and ReportLab are imported on first use (fast-path and cached answers
+# never need them), so replicas start and reruns execute quickly.
+from query_cache import QueryCache, extract_raw_sql
+from answer_cache import AnswerCache, final_sql, schema_fingerprint, time_dependent
+from fast_path import match_route
+from gtfs_schedule import agency_timezone, service_today
+from request_pipeline import answer_with_domain_check, shared_http_client
+from schema_context import count_tokens
+from result_pager import is_pageable
+from result_export import MIME_TYPES, export_file, frame_stream, result_hash
+from chat_history import MAX_MESSAGES, HistoryStore, windowed_history
+from agent_stack import build_agent, build_sql_database, preload_agent_modules
+from answer_stream import AnswerStreamer
+from prompt_bundle import (
+    PROMPT_DIR, PromptBundle, load_prompt_bundle, load_table_info, prompt_key,
+    store_table_info,
+)
+from tracing import LatencyTracer, TraceSink
 
-def load_history():
-    if HISTORY_FILE.exists():
-        try:
-            with open(HISTORY_FILE) as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            # If file is corrupt or empty, start fresh
-            return []
-    return []
-
-def load_modular_system_prompt(folder: str = "modular_prompt") -> str:
-    """
-    Load and concatenate all modular instruction files into one system prompt string.
-    Files are read in alphabetical order.
-    """
-    folder_path = Path(folder)
-    if not folder_path.exists():
-        raise FileNotFoundError(f"Missing prompt folder: {folder_path}")
-    
-    parts = []
-    for file in sorted(folder_path.glob("*.*")):
-        parts.append(file.read_text().strip())
-    
-    return "\n\n".join(parts)
 
-# Load the final system prompt
-def ascii_clean(text: str) -> str:
-    """Remove problematic unicode characters from prompts."""
-    return (
-        unicodedata.normalize("NFKD", text)
-        .encode("ascii", errors="ignore")
-        .decode("ascii")
-    )
+@st.cache_resource(max_entries=2)
+def get_prompt_bundle(key: str) -> PromptBundle:
+    """System prompt + pruner, compiled once per version of modular_prompt/."""
+    return load_prompt_bundle(PROMPT_DIR, key)
 
-SYSTEM_PROMPT = ascii_clean(load_modular_system_prompt())
+# Hashing the prompt files is cheap; editing one picks up a new bundle
+PROMPT_BUNDLE = get_prompt_bundle(prompt_key(PROMPT_DIR))
+SYSTEM_PROMPT = PROMPT_BUNDLE.system_prompt
+PROMPT_HASH = PROMPT_BUNDLE.prompt_hash
+PROMPT_PRUNER = PROMPT_BUNDLE.pruner
 
 def extract_markdown_table(markdown_text: str) -> pd.DataFrame | None:
     """Try to extract a DataFrame from a markdown table in a string."""
@@ -97,8 +64,11 @@ def extract_markdown_table(markdown_text: str) -> pd.DataFrame | None:
             return None
     return None
 
-def display_response_with_downloads(response) -> str:
-    """Display a response and return the assistant reply content (for chat history)."""
+def display_response_with_downloads(response, into=st) -> str:
+    """Display a response and return the assistant reply content (for chat history).
+
+    `into` is where to render: `st` itself or a container / placeholder.
+    """
     response_df = None
 
     if isinstance(response, pd.DataFrame):
@@ -109,102 +79,120 @@ def display_response_with_downloads(response) -> str:
     if response_df is not None:
         # ✅ Cache for future reruns
         st.session_state["last_response_df"] = response_df
-        st.dataframe(response_df)
-
-        format_choice = st.radio(
-            "📁 Choose download format:",
-            options=["CSV", "PDF"],
-            horizontal=True,
-            index=0,
-            key="format_selector",  # persist across reruns
+        st.session_state.pop("last_result", None)
+        into.dataframe(response_df)
+        render_download_buttons(
+            result_hash(list(response_df.columns), pd.util.hash_pandas_object(response_df, index=False).tolist()),
+            lambda: frame_stream(response_df),
+            into=into,
         )
-
-        if format_choice == "CSV":
-            st.download_button(
-                label="📥 Download as CSV",
-                data=response_df.to_csv(index=False).encode("utf-8"),
-                file_name="query_result.csv",
-                mime="text/csv",
-            )
-        elif format_choice == "PDF":
-            from reportlab.platypus import Image, Spacer
-            from reportlab.lib.units import inch
-
-            pdf_buffer = BytesIO()
-            doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
-
-            # ⬇️ Build story with optional logo
-            story = []
-
-            # ✅ Add logo at top (adjust path/size)
-            logo_path = "logo.png"  # relative or absolute path to your logo file
-            try:
-                logo = Image(logo_path, width=2.0 * inch, height=1.0 * inch)
-                story.append(logo)
-                story.append(Spacer(1, 0.25 * inch))
-            except Exception as e:
-                st.warning(f"⚠️ Could not load logo: {e}")
-
-            # ⬇️ Add table
-            data = [response_df.columns.tolist()] + response_df.values.tolist()
-            table = Table(data)
-            table.setStyle(TableStyle([
-                ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
-                ("GRID", (0, 0), (-1, -1), 1, colors.grey),
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-            ]))
-
-            story.append(table)
-            doc.build(story)
-
-            pdf_bytes = pdf_buffer.getvalue()
-
-            st.download_button(
-                label="📥 Download as PDF",
-                data=pdf_bytes,
-                file_name="query_result.pdf",
-                mime="application/pdf",
-            )
-
-
         return "Here is the table you requested. Use the buttons above to download it as CSV or PDF."
     else:
         return response
 
-###############################################################################
-# ---------- Developer system instructions -----------------------------------
-###############################################################################
-FORMAT_INSTRUCTIONS = """
-Use the following format in your response:
+def render_download_buttons(result_key: str, make_stream, formats=("CSV", "PDF"), into=st):
+    """CSV / PDF download buttons; the file is only generated (and cached) on click."""
+    format_choice = into.radio(
+        "📁 Choose download format:",
+        options=list(formats),
+        horizontal=True,
+        index=0,
+        key="format_selector",  # persist across reruns
+    )
+    fmt = format_choice.lower()
+    into.download_button(
+        label=f"📥 Download as {format_choice}",
+        data=lambda: export_file(result_key, fmt, make_stream).read_bytes(),
+        file_name=f"query_result.{fmt}",
+        mime=MIME_TYPES[fmt],
+    )
 
-Thought: Do I need to use a tool? Yes or No.
-If Yes:
-Action: the action to take, must be one of [sql_db_list_tables, sql_db_schema, sql_db_query]
-Action Input: the input to the action
+def render_page(table, pager, page: int) -> int:
+    """Fill the `table` placeholder with one page, a chunk at a time; return its row count."""
+    frames = []
+    for chunk in pager.page_chunks(page):
+        frames.append(chunk)
+        table.dataframe(pd.concat(frames, ignore_index=True))
+    return sum(len(frame) for frame in frames)
 
-IMPORTANT:
-- NEVER output both a Final Answer and an Action block together.
-- If you're taking an Action, you must wait for its result before outputting a Final Answer.
+def preview_sql_result(placeholder, sql: str):
+    """Rows an agent query already fetched, shown while the agent is still answering.
 
-If No:
-Thought: Do I need to use a tool? No.
-Final Answer: the final answer to the original input question.
+    Runs in the agent's callback thread, so it never touches the database.
+    """
+    preview = db.preview_frame(sql)
+    if preview is not None:
+        placeholder.dataframe(preview[0])
+
+# Larger results can still be exported as CSV, but not laid out as a PDF
+PDF_ROW_CAP = 50_000
+
+def display_sql_result(sql: str, params: dict | None = None, total_rows: int | None = None,
+                       into=st) -> str | None:
+    """Show the result of `sql` one page at a time, fetching only the visible page.
+
+    Only the SQL is kept in the session, so reruns (page changes, the
+    "previous result" view) re-fetch a single page.  Rows are drawn as
+    they are fetched; a new result is counted only after its first page
+    is on screen (and not at all when it fits on one page).  Returns the
+    chat reply, or None when the query returned no rows.
+    """
+    sql = extract_raw_sql(sql)
+    if not is_pageable(sql):
+        return display_response_with_downloads(db.query_frame(sql, params), into)
+
+    pager = db.pager(sql, params)
+    nav, table = into.container(), into.empty()   # page selector above the rows
+    page, drawn = 1, False
+    if total_rows is None:  # a new result: show page 1, then remember it
+        # The agent's tool may already hold every row: no re-run, no COUNT(*)
+        fetched = db.preview_frame(sql) if not params else None
+        if fetched is not None and fetched[1] and len(fetched[0]) < pager.page_size:
+            shown = len(fetched[0])
+            if shown:
+                table.dataframe(fetched[0])
+        else:
+            shown = render_page(table, pager, 1)
+        drawn = True
+        if shown == 0:
+            return None
+        total_rows = shown if shown < pager.page_size else pager.total_rows()
+        st.session_state["last_result"] = {"sql": sql, "params": params, "rows": total_rows}
+        st.session_state.pop("last_response_df", None)
+        st.session_state["result_page"] = 1
+
+    pages = pager.page_count(total_rows)
+    if pages > 1:
+        page = nav.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, key="result_page")
+    if not drawn:
+        render_page(table, pager, page)
+    first = (page - 1) * pager.page_size + 1
+    into.caption(f"Rows {first:,}–{min(page * pager.page_size, total_rows):,} of {total_rows:,}")
+
+    render_download_buttons(
+        result_hash(sql, params, generation),
+        pager.stream,
+        formats=("CSV", "PDF") if total_rows <= PDF_ROW_CAP else ("CSV",),
+        into=into,
+    )
+    return "Here is the table you requested. Use the buttons above to download it as CSV or PDF."
 
- Always use the phrase 'Final Answer:' exactly — or the system will throw a parsing error.
-"""
+@st.cache_resource
+def get_http_client():
+    """Pooled HTTP client shared by every OpenAI call in this process."""
+    return shared_http_client()
 
-def extract_raw_sql(text: str) -> str:
-    """Extracts the raw SQL query from markdown-fenced output, or returns raw."""
-    #match = re.search(r"```sql\s+(.?)```", text, re.DOTALL | re.IGNORECASE)
-    match = re.search(r"```sql\s+(.*?)```", text, re.DOTALL | re.IGNORECASE)
-    return match.group(1).strip() if match else text.strip()
 
+@st.cache_resource
+def get_openai_client(api_key: str):
+    """OpenAI SDK client reused across questions and sessions."""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=get_http_client())
 
 
 def is_transit_related(query: str, api_key: str) -> bool:
     """Check if the user's query is related to fleet/transit/dispatch (for OpenAI SDK v1.0+)."""
-    from openai import OpenAI
-    client = OpenAI(api_key=api_key)
+    client = get_openai_client(api_key)
 
     prompt = (
         "Is the following question about public transportation, electric buses, "
@@ -228,7 +216,18 @@ def is_transit_related(query: str, api_key: str) -> bool:
 ###############################################################################
 # ---------- Utility helpers --------------------------------------------------
 ###############################################################################
-DB_FILE = Path(__file__).parent / "vehicles.db"
+DB_FILE = Path(os.environ.get("VEHICLES_DB", Path(__file__).parent / "vehicles.db"))
+
+def db_generation(db_path: Path) -> tuple:
+    """Cheap fingerprint of the published DB that changes on every loader COMMIT.
+
+    The loaders publish through WAL, so a commit touches `vehicles.db-wal`
+    and a checkpoint touches the main file; both mtimes form the key.
+    """
+    return tuple(
+        p.stat().st_mtime_ns if p.exists() else 0
+        for p in (db_path, db_path.with_name(db_path.name + "-wal"))
+    )
 
 def ascii_sanitise(value: str) -> str:
     """Return a strictly-ASCII version of `value`."""
@@ -238,17 +237,6 @@ def ascii_sanitise(value: str) -> str:
         .decode("ascii")
     )
 
-def convert_to_message_history(messages):
-    from langchain_core.messages import AIMessage, HumanMessage
-
-    history = []
-    for msg in messages:
-        if msg["role"] == "user":
-            history.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            history.append(AIMessage(content=msg["content"]))
-    return history
-
 ###############################################################################
 # ---------- Streamlit sidebar (API key only) ---------------------------------
 ###############################################################################
@@ -268,114 +256,136 @@ api_key = ascii_sanitise(api_key_raw or "")
 if not api_key:
     st.warning("OpenAI API key not found. Please add it to Streamlit secrets or enter it above.")
     st.stop()
-st.session_state.setdefault("messages", load_history())
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    """Append-only per-session chat history shared by every session."""
+    return HistoryStore()
+
+
+# One history per browser session; the id lives in the URL so a reload resumes it
+session_id = st.query_params.get("sid") or uuid.uuid4().hex
+st.query_params["sid"] = session_id
+history_store = get_history_store()
+
+if "messages" not in st.session_state:
+    stored_messages = history_store.load(session_id)
+    if stored_messages:
+        st.session_state.messages = stored_messages
+
+
+def remember(role: str, content: str):
+    """Append a message to the on-screen list (bounded) and the history store."""
+    st.session_state.messages.append({"role": role, "content": content})
+    del st.session_state.messages[:-MAX_MESSAGES]
+    history_store.append(session_id, role, content)
+
 ###############################################################################
 # ---------- Configure DB connection (cached, auto-invalidated) --------------
 ###############################################################################
-@st.cache_resource(ttl=0)
-def get_db_connection(db_path: Path, api_key_ascii: str):
-    """Return (SQLDatabase, ChatOpenAI LLM) tuple."""
-    if not db_path.exists():
-        raise FileNotFoundError(f"Database file not found at: {db_path}")
-
-    st.session_state["_db_mtime"] = db_path.stat().st_mtime  # refresh on change
-
-    from sqlalchemy.pool import StaticPool
-
-    # ⬇️ Open in read-only mode so no accidental writes occur
-    creator = lambda: sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
-    engine = create_engine(
-        "sqlite://",
-        creator=creator,
-        poolclass=StaticPool,
-        connect_args={"check_same_thread": False},
-    )
-    sql_db = SQLDatabase(engine)
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    """Process-wide `sql_db_query` result cache shared by every session."""
+    return QueryCache()
+
+@st.cache_resource(max_entries=1, on_release=lambda db: db._engine.dispose())
+def get_db_connection(db_path: Path, generation: tuple):
+    """Return the guarded, cached SQLDatabase.
+
+    `generation` (see `db_generation`) is only part of the cache key: a new
+    DB generation builds a fresh engine/schema and evicts the old one.
+    """
+    return build_sql_database(db_path, get_query_cache(), generation)
+
 
-    llm = ChatOpenAI(
+# Agents / chat models kept per (API key, DB generation): sessions with
+# different keys must not evict each other's agent on every question
+MAX_AGENTS = 8
+
+
+@st.cache_resource(max_entries=MAX_AGENTS)
+def get_llm(api_key_ascii: str):
+    """ChatOpenAI model; langchain_openai is only imported for agent questions."""
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
         openai_api_key=api_key_ascii,
         model_name="gpt-4.1-mini",
         #model_name="o4-mini",
         #model_name="o4-mini",
         streaming=True,
-        temperature=0.5
+        stream_usage=True,  # token counts for the latency traces
+        temperature=0.5,
+        http_client=get_http_client(),
     )
 
-    return sql_db, llm
 
+@st.cache_resource
+def preload_agent() -> bool:
+    """Once per process: import the agent stack in the background after start."""
+    preload_agent_modules("langchain_openai", "langchain_community.callbacks.streamlit")
+    return True
 
-db, llm = get_db_connection(DB_FILE, api_key)
 
-###############################################################################
-# ---------- Capture baseline tables -----------------------------------------
-###############################################################################
-if "base_tables" not in st.session_state:
-    with sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True) as _conn:
-        st.session_state["base_tables"] = {
-            row[0] for row in _conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table';"
-            )
-        }
+@st.cache_resource
+def get_trace_sink() -> TraceSink:
+    """Latency trace store shared by every session (see pages/latency.py)."""
+    return TraceSink()
 
-###############################################################################
-# ---------- LangChain agent with custom prompt ------------------------------
-###############################################################################
-toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-# custom_prefix = SYSTEM_INSTRUCTIONS.strip() + "\n\n" + _LC_SQL_PREFIX
-#escaped_system_instructions = SYSTEM_INSTRUCTIONS.replace("{", "{{").replace("}", "}}")
-escaped_system_instructions = SYSTEM_PROMPT.replace("{", "{{").replace("}", "}}")
-
-
-custom_prefix = (
-    escaped_system_instructions.strip()
-    + "\n\n"
-    + FORMAT_INSTRUCTIONS.strip()
-    + "\n\n"
-    + _LC_SQL_PREFIX.strip()
-)
 
+@st.cache_resource
+def get_answer_cache() -> AnswerCache:
+    """Persistent question → SQL cache shared by every session."""
+    return AnswerCache()
 
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", escaped_system_instructions),
-    ("system", FORMAT_INSTRUCTIONS),
-    ("system", _LC_SQL_PREFIX),
-    ("system", "You can use the following tools:\n{tools}"),
-    ("system", "Tool names: {tool_names}"),
-    MessagesPlaceholder("history"),  # ✅ keep this!
-    ("human", "{input}"),
-    ("ai", "{agent_scratchpad}")
-])
-
-_base_agent = create_sql_agent(
-    llm=llm,
-    toolkit=toolkit,
-    prompt=prompt,  # ✅ Now fully compatible
-    agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True,
-)
+@st.cache_data(max_entries=4)
+def get_schema_hash(db_path: Path, generation: tuple) -> str:
+    """Schema fingerprint, recomputed only when the DB generation changes."""
+    return schema_fingerprint(db_path)
+
+
+@st.cache_data(max_entries=4)
+def get_agency_timezone(db_path: Path, generation: tuple) -> str | None:
+    """The feed's agency_timezone, re-read only when the DB generation changes."""
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+        return agency_timezone(conn)
+
 
-agent = AgentExecutor.from_agent_and_tools(
-    agent=_base_agent.agent,
-    tools=toolkit.get_tools(),
-    handle_parsing_errors=True,
-    return_intermediate_steps=True,
-    verbose=True,
-    max_iterations=50,         # Adjust this as needed
-    max_execution_time=100,    # In seconds
+generation = db_generation(DB_FILE)
+db = get_db_connection(DB_FILE, generation)
+answer_cache = get_answer_cache()
+schema_hash = get_schema_hash(DB_FILE, generation)
+
+_query_cache = get_query_cache()
+st.sidebar.caption(
+    f"🗄️ Query cache: {_query_cache.hits} hits · {_query_cache.misses} misses "
+    f"· {len(_query_cache)} entries"
 )
 
 ###############################################################################
-# ---------- Table Download UI (new tables only) -----------------------------
+# ---------- LangChain agent with custom prompt ------------------------------
 ###############################################################################
-#st.sidebar.markdown("### 📥 Download new Table as CSV")
+@st.cache_resource(max_entries=MAX_AGENTS)
+def get_agent(db_path: Path, api_key_ascii: str, generation: tuple):
+    """Toolkit + agent + executor, built on the first agent question per process,
+    API key and DB generation.
+
+    The executor holds no per-session state (callbacks and history are
+    passed to each `invoke`), so every session with the same key shares it.
+    The DB connection and the bundled schema summary are shared across
+    keys, so building an agent for another key is cheap.  The schema
+    summary comes from the bundle for this schema when there is one.
+    """
+    db = get_db_connection(db_path, generation)
+    fingerprint = get_schema_hash(db_path, generation)
+    cached_info = load_table_info(fingerprint)
+    table_info = db.snapshot_table_info(cached_info)
+    if table_info != cached_info:   # new schema (or new tables): save it
+        store_table_info(fingerprint, table_info)
+    return build_agent(db, get_llm(api_key_ascii), table_info=table_info)
 
-with sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True) as _conn:
-    current_tables = {
-        row[0] for row in _conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table';"
-        )
-    }
+preload_agent()
 
 ###############################################################################
 # ---------- Chat UI & session history ---------------------------------------
@@ -384,6 +394,7 @@ if (
     "messages" not in st.session_state
     or st.button("🗑️ Clear chat history", help="Start a fresh session")
 ):
+    history_store.clear(session_id)
     st.session_state.messages = [
         {
             "role": "assistant",
@@ -401,40 +412,138 @@ user_query = st.chat_input("Ask a question…")
 if user_query:
     user_query = unicodedata.normalize("NFKD", user_query).encode("ascii", errors="ignore").decode("ascii")
     st.chat_message("user").write(user_query)
-    st.session_state.messages.append({"role": "user", "content": user_query})
-    save_history()
+    remember("user", user_query)
 
     with st.chat_message("assistant"):
-        cb = StreamlitCallbackHandler(st.container())
+        thoughts = st.container()   # the agent's steps render here, above the answer
+        tracer = LatencyTracer(get_trace_sink(), user_query)
+        answer_path, trace_error = "agent", None
+        answer_box = None
         try:
-            history = convert_to_message_history(st.session_state.messages)
-
-            # Run the agent with full trace
-            response = agent.invoke(
-                {
-                    "input": user_query,
-                    "history": history
-                },
-                callbacks=[cb]
-            )
-
-            # --- Extract assistant's reply ---
-            #assistant_reply = response.get("output", response) if isinstance(response, dict) else response
-            #chat_reply = display_response_with_downloads(assistant_reply)
-            # Extract steps + output
-            intermediate_steps = response.get("intermediate_steps", []) if isinstance(response, dict) else []
-            assistant_reply = response.get("output", response) if isinstance(response, dict) else response
-            chat_reply = display_response_with_downloads(assistant_reply)
-
-            # 🧠 Display chain of thought if available
-            if intermediate_steps:
-                with st.expander("🧠 Agent Chain of Thought", expanded=False):
-                    for i, (action, observation) in enumerate(intermediate_steps):
-                        st.markdown(f"**Step {i+1}:**")
-                        st.markdown(f"- **Thought**: {action.log.strip()}")
-                        st.markdown(f"- **Tool Used**: `{action.tool}`")
-                        st.markdown(f"- **Input**: `{action.tool_input}`")
-                        st.markdown(f"- **Observation**: `{observation}`")
+            chat_reply = None
+
+            # 🚀 Canonical dispatch questions: fixed parameterized SQL, no LLM
+            service_date = service_today(get_agency_timezone(DB_FILE, generation))
+            route = match_route(user_query, db.get_usable_table_names(),
+                                {"service_date": service_date.isoformat()})
+            if route:
+                template, params = route
+                try:
+                    with tracer.timed("sql", template.name):
+                        chat_reply = (
+                            display_sql_result(template.sql, params)
+                            or template.empty_reply.format(**params)
+                        )
+                    answer_path = "fast_path"
+                    st.caption(f"🚀 Fast path: `{template.name}` template (no LLM call)")
+                except Exception:
+                    chat_reply = None  # e.g. column drift: let the agent handle it
+
+            # ⚡ Repeated question: re-run the SQL the agent settled on last time
+            cached_sql = None
+            if chat_reply is None and not time_dependent(user_query):
+                cached_sql = answer_cache.lookup(user_query, PROMPT_HASH, schema_hash)
+            if cached_sql:
+                try:
+                    with tracer.timed("sql", "cached_sql"):
+                        chat_reply = display_sql_result(cached_sql) or "The query returned no rows."
+                    answer_path = "answer_cache"
+                    st.caption("⚡ Answered from cache (SQL re-run on current data)")
+                    with st.expander("🧾 Cached SQL", expanded=False):
+                        st.code(cached_sql, language="sql")
+                except Exception:
+                    answer_cache.forget(user_query, PROMPT_HASH, schema_hash)
+
+            if chat_reply is None:
+                from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
+
+                agent = get_agent(DB_FILE, api_key, generation)
+                llm = get_llm(api_key)
+                cb = StreamlitCallbackHandler(thoughts)
+
+                # Recent turns within a token budget (the current question is `input`)
+                history = windowed_history(
+                    st.session_state.messages[:-1], lambda text: count_tokens(llm, text)
+                )
+
+                # ✂️ Send only the prompt sections for the tables this question needs
+                system_prompt, prompt_tables = PROMPT_PRUNER.build(user_query)
+                st.caption(
+                    f"🧮 System prompt: {count_tokens(llm, system_prompt):,} tokens "
+                    f"(full: {count_tokens(llm, SYSTEM_PROMPT):,})"
+                    + (f" · tables: {', '.join(sorted(prompt_tables))}" if prompt_tables else "")
+                )
+
+                # 🌊 Rows of the agent's queries as soon as it has them, then the
+                # final answer token by token (callbacks run in the agent thread)
+                preview, answer_box = st.empty(), st.empty()
+                streamer = AnswerStreamer(
+                    on_text=lambda text, final: answer_box.markdown(text if final else text + " ▌"),
+                    on_query=lambda sql: preview_sql_result(preview, sql),
+                )
+
+                # Run the agent with full trace, concurrently with the domain check
+                def classify():
+                    with tracer.timed("check", "domain_check"):
+                        return is_transit_related(user_query, api_key)
+
+                is_transit, response = answer_with_domain_check(
+                    classify,
+                    lambda cancel_cb: agent.invoke(
+                        {
+                            "input": user_query,
+                            "history": history,
+                            "system_prompt": system_prompt,
+                        },
+                        callbacks=[cancel_cb, cb, tracer, streamer]
+                    ),
+                )
+                if not is_transit:
+                    preview.empty()
+                    answer_path = "rejected"
+                    chat_reply = (
+                        "🚫 I can only help with questions about the transit fleet, "
+                        "dispatch, scheduling and vehicle data in vehicles.db."
+                    )
+
+            if chat_reply is None:
+                # --- Extract assistant's reply ---
+                #assistant_reply = response.get("output", response) if isinstance(response, dict) else response
+                #chat_reply = display_response_with_downloads(assistant_reply)
+                # Extract steps + output
+                intermediate_steps = response.get("intermediate_steps", []) if isinstance(response, dict) else []
+                assistant_reply = response.get("output", response) if isinstance(response, dict) else response
+
+                # Tabular answers: show the full result of the agent's final SQL
+                # (the LLM itself only saw a capped preview) instead of its markdown
+                answer_sql = final_sql(intermediate_steps)
+                is_table = isinstance(assistant_reply, str) and extract_markdown_table(assistant_reply) is not None
+                # The table replaces the streamed preview in place (or clears it)
+                if answer_sql and is_table:
+                    try:
+                        with tracer.timed("sql", "final_sql"):
+                            chat_reply = display_sql_result(answer_sql, into=preview.container())
+                    except Exception:
+                        chat_reply = None
+                if chat_reply is None:
+                    chat_reply = display_response_with_downloads(
+                        assistant_reply, into=preview.container()
+                    )
+
+                # Only tabular answers are cached: a re-run of their SQL reproduces them
+                # (unless the question or the SQL is tied to the day it was asked)
+                if answer_sql and is_table and not time_dependent(user_query, answer_sql):
+                    answer_cache.store(user_query, PROMPT_HASH, schema_hash, answer_sql)
+
+                # 🧠 Display chain of thought if available
+                if intermediate_steps:
+                    with st.expander("🧠 Agent Chain of Thought", expanded=False):
+                        for i, (action, observation) in enumerate(intermediate_steps):
+                            st.markdown(f"**Step {i+1}:**")
+                            st.markdown(f"- **Thought**: {action.log.strip()}")
+                            st.markdown(f"- **Tool Used**: `{action.tool}`")
+                            st.markdown(f"- **Input**: `{action.tool_input}`")
+                            st.markdown(f"- **Observation**: `{observation}`")
 
 
         except UnicodeEncodeError:
@@ -442,15 +551,28 @@ if user_query:
                 "⚠️ I encountered a Unicode encoding issue while talking to the LLM. "
                 "Please try rephrasing your question using plain ASCII characters."
             )
+            trace_error = "UnicodeEncodeError"
         except Exception as e:
             chat_reply = f"⚠️ Something went wrong:\n\n`{e}`"
+            trace_error = repr(e)
 
-        st.write(chat_reply)
+        tracer.finish(answer_path, trace_error)
+        # Agent answers replace their streamed text in place
+        (answer_box or st).write(chat_reply)
 
         # Always store assistant reply as a string (not dict or DataFrame)
-        st.session_state.messages.append({"role": "assistant", "content": str(chat_reply)})
-        save_history()
+        remember("assistant", str(chat_reply))
 
-if not user_query and "last_response_df" in st.session_state:
+if not user_query and "last_result" in st.session_state:
+    st.write("📌 Here's your previous result:")
+    last = st.session_state["last_result"]
+    try:
+        display_sql_result(last["sql"], last["params"], total_rows=last["rows"])
+    except Exception as e:
+        st.warning(f"⚠️ Could not reload the previous result: {e}")
+elif not user_query and "last_response_df" in st.session_state:
     st.write("📌 Here's your previous result:")
     display_response_with_downloads(st.session_state["last_response_df"])
+
+# ⏱️ This run's script time (a process's first run also pays the imports)
+st.sidebar.caption(f"⏱️ Script run: {(time.perf_counter() - _SCRIPT_STARTED) * 1000:,.0f} ms")
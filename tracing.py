@@ -0,0 +1,200 @@
+"""
+tracing.py – per-question latency traces for the chat agent.
+
+`LatencyTracer` is a LangChain callback handler that runs next to the
+StreamlitCallbackHandler and records one span per LLM call (latency,
+time-to-first-token, prompt/completion tokens) and per tool call
+(duration, rows returned by `sql_db_query`), plus a span for the whole
+question.  Spans are written in one batch per question to a local SQLite
+file; `pages/latency.py` shows p50/p95 breakdowns from it.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACE_FILE = Path(__file__).parent / "traces.db"
+RETENTION_DAYS = 30
+
+SPAN_COLUMNS = (
+    "trace_id", "question", "kind", "name", "started_at", "duration_ms",
+    "ttft_ms", "prompt_tokens", "completion_tokens", "rows", "steps", "error",
+)
+
+
+def _row_count(output) -> int | None:
+    """Rows in a `sql_db_query` observation ("[(...), (...)]" + optional note)."""
+    first_line = str(output).split("\n", 1)[0]
+    if first_line.startswith("[("):
+        return first_line.count("), (") + 1
+    if first_line.startswith("[{"):
+        return first_line.count("}, {") + 1
+    return 0 if not first_line else None
+
+
+def _token_usage(response) -> tuple[int | None, int | None]:
+    """(prompt, completion) tokens from an LLMResult, if the provider sent them."""
+    for generations in response.generations or []:
+        for gen in generations:
+            usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+class TraceSink:
+    """SQLite-backed span store; a short-lived connection per call keeps it thread-safe."""
+
+    def __init__(self, path: Path = TRACE_FILE):
+        self.path = Path(path)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS spans ("
+                " trace_id TEXT, question TEXT, kind TEXT, name TEXT,"
+                " started_at REAL, duration_ms REAL, ttft_ms REAL,"
+                " prompt_tokens INTEGER, completion_tokens INTEGER,"
+                " rows INTEGER, steps INTEGER, error TEXT)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_spans__started_at ON spans (started_at)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def write(self, spans: list[dict]):
+        if not spans:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO spans ({', '.join(SPAN_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(SPAN_COLUMNS))})",
+                [tuple(span.get(c) for c in SPAN_COLUMNS) for span in spans],
+            )
+            conn.execute(
+                "DELETE FROM spans WHERE started_at < ?",
+                (time.time() - RETENTION_DAYS * 86400,),
+            )
+
+    def load(self, since: float = 0.0) -> pd.DataFrame:
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT * FROM spans WHERE started_at >= ? ORDER BY started_at",
+                conn,
+                params=(since,),
+            )
+
+
+class LatencyTracer(BaseCallbackHandler):
+    """Collects LLM / tool spans for one question; `finish()` writes them out."""
+
+    def __init__(self, sink: TraceSink, question: str):
+        self.sink = sink
+        self.question = question
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.time()
+        self.spans = []
+        self._open = {}                 # run_id → partially filled span
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------- helpers
+    def _start(self, run_id, kind, name):
+        with self._lock:
+            self._open[run_id] = {
+                "trace_id": self.trace_id, "question": self.question,
+                "kind": kind, "name": name, "started_at": time.time(),
+                "_t0": time.perf_counter(),
+            }
+
+    def _end(self, run_id, **fields):
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            if span is None:
+                return
+            span["duration_ms"] = (time.perf_counter() - span.pop("_t0")) * 1000
+            span.pop("_first_token", None)
+            span.update(fields)
+            self.spans.append(span)
+
+    # -------------------------------------------------------------------- LLM
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", (serialized or {}).get("name") or "chat_model")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", (serialized or {}).get("name") or "llm")
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            span = self._open.get(run_id)
+            if span is not None and "_first_token" not in span:
+                span["_first_token"] = True
+                span["ttft_ms"] = (time.perf_counter() - span["_t0"]) * 1000
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    # ------------------------------------------------------------------ tools
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or "tool")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        with self._lock:
+            name = self._open.get(run_id, {}).get("name")
+        rows = _row_count(getattr(output, "content", output)) if name == "sql_db_query" else None
+        self._end(run_id, rows=rows)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+    @contextmanager
+    def timed(self, kind: str, name: str):
+        """Span for work outside LangChain (domain check, template / cached SQL)."""
+        run_id = uuid.uuid4()
+        self._start(run_id, kind, name)
+        try:
+            yield
+        except Exception as e:
+            self._end(run_id, error=repr(e))
+            raise
+        self._end(run_id)
+
+    # --------------------------------------------------------------- question
+    def finish(self, path: str, error: str | None = None):
+        """Record the whole-question span (`path`: agent / fast_path / answer_cache)."""
+        steps = sum(1 for s in self.spans if s["kind"] == "llm")
+        self.spans.append({
+            "trace_id": self.trace_id, "question": self.question,
+            "kind": "question", "name": path, "started_at": self.started,
+            "duration_ms": (time.time() - self.started) * 1000,
+            "steps": steps,   # LLM calls (ReAct iterations) for this question
+            "error": error,
+        })
+        try:
+            self.sink.write(self.spans)
+        except sqlite3.Error:
+            pass   # tracing must never break answering
+
+
+def latency_summary(spans: pd.DataFrame) -> pd.DataFrame:
+    """p50 / p95 / max duration (ms) and counts per span kind and name."""
+    if spans.empty:
+        return pd.DataFrame()
+    grouped = spans.groupby(["kind", "name"])
+    summary = grouped["duration_ms"].describe(percentiles=[0.5, 0.95])
+    summary = summary.rename(columns={"50%": "p50_ms", "95%": "p95_ms", "max": "max_ms"})
+    summary = summary[["count", "p50_ms", "p95_ms", "max_ms"]]
+    summary["p50_ttft_ms"] = grouped["ttft_ms"].median()
+    summary["avg_prompt_tokens"] = grouped["prompt_tokens"].mean()
+    summary["avg_completion_tokens"] = grouped["completion_tokens"].mean()
+    return summary.round(1).reset_index()